@@ -1,4 +1,4 @@
-""" This code imports everything from /classes and /utils to use for stuff like `backend.utils.text_manipulation """
+""" Lets subpackages in /backend be reached as attributes (like `backend.utils.text_manipulation`), importing each only when it is first used """
 
 import pkgutil
 import os
@@ -7,10 +7,11 @@ import importlib
 # Get the directory that this __init__.py file is in
 current_dir = os.path.dirname(os.path.realpath(__file__))
 
-# Iterate over all Python files in this directory (excluding this __init__.py file)
-for (_, module_name, _) in pkgutil.iter_modules([current_dir]):
-    # Avoid reloading this __init__.py file
-    if module_name == "__init__":
-        continue
-    # Dynamically import the module
-    importlib.import_module("." + module_name, package=__name__)
\ No newline at end of file
+__all__ = [module_name for (_, module_name, _) in pkgutil.iter_modules([current_dir])]
+
+
+def __getattr__(name):
+    # PEP 562: only called for attributes that don't exist yet, so each module is imported once, on first access
+    if name in __all__:
+        return importlib.import_module("." + name, package=__name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
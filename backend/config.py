@@ -16,17 +16,69 @@ try:
     log_level: str = config.get('general', 'log_level')
     presence: str = config.get('general', 'presence')
     version: str = config.get('general', 'version', fallback="unknown")
+    # reload cogs as soon as their files change, for development
+    watch_cogs: bool = config.getboolean('general', 'watch_cogs', fallback=False)
+    watch_interval: float = config.getfloat('general', 'watch_interval', fallback=1.0)
 
     # Getting the variables from `[secret]`
     discord_token: str = config.get('secret', 'discord_token')
+    # keys the RNG streams that rolls can be replayed from; the token stands in if it isn't set
+    rng_secret: str = config.get('secret', 'rng_secret', fallback=discord_token)
 
     # Getting the variables from `[discord]`
     embed_footer: str = config.get('discord', 'embed_footer')
     sync_server: int = config.getint('discord', 'sync_server', fallback=0)
     should_sync: bool = config.getboolean('discord', 'should_sync', fallback=False)
+    # log which command scopes would be synced, without syncing them
+    sync_dry_run: bool = config.getboolean('discord', 'sync_dry_run', fallback=False)
     embed_color: int = int(config.get('discord', 'embed_color'), base=16)
     embed_url: str = config.get('discord', 'embed_url')
 
+    # Getting the variables from `[rolling]`
+    plan_cache_size: int = config.getint('rolling', 'plan_cache_size', fallback=1024)
+    vectorize_threshold: int = config.getint('rolling', 'vectorize_threshold', fallback=256)
+    cost_per_die: float = config.getfloat('rolling', 'cost_per_die', fallback=1.0)
+    cost_per_modifier: float = config.getfloat('rolling', 'cost_per_modifier', fallback=0.5)
+    offload_cost: float = config.getfloat('rolling', 'offload_cost', fallback=20000)
+    offload_timeout: float = config.getfloat('rolling', 'offload_timeout', fallback=2.5)
+    offload_workers: int = config.getint('rolling', 'offload_workers', fallback=2)
+    # the most possible results cached across all distributions; with NumPy, each takes 16 bytes (PMF and CDF)
+    distribution_cache_points: int = config.getint('rolling', 'distribution_cache_points', fallback=4_000_000)
+    distribution_max_support: int = config.getint('rolling', 'distribution_max_support', fallback=2_000_000)
+    color_mode: str = config.get('rolling', 'color_mode', fallback="percentile")
+    color_max_support: int = config.getint('rolling', 'color_max_support', fallback=100_000)
+
+    # Getting the variables from `[generation]`
+    username_endpoint: str = config.get('generation', 'username_endpoint',
+                                        fallback="https://users.roblox.com/v1/users/{id}")
+    username_timeout: float = config.getfloat('generation', 'username_timeout', fallback=2.0)
+    username_pool_size: int = config.getint('generation', 'username_pool_size', fallback=100)
+    username_pool_low_water: int = config.getint('generation', 'username_pool_low_water', fallback=30)
+    # remote lookups per second while refilling the pool
+    username_rate: float = config.getfloat('generation', 'username_rate', fallback=5.0)
+
+    # Getting the variables from `[database]`
+    user_cache_size: int = config.getint('database', 'user_cache_size', fallback=10_000)
+    # seconds between writes of changed users to disk
+    flush_interval: float = config.getfloat('database', 'flush_interval', fallback=5.0)
+
+    # Getting the variables from `[battle]`
+    # seconds of CPU time a /battle_sim gets; it stops early with fewer trials if it runs out
+    battle_sim_budget: float = config.getfloat('battle', 'sim_budget', fallback=0.75)
+    battle_sim_chunk: int = config.getint('battle', 'sim_chunk', fallback=50_000)
+    # standard deviation of each side's strength, as a log-normal factor
+    battle_sim_noise: float = config.getfloat('battle', 'sim_noise', fallback=0.1)
+
+    # Getting the variables from `[history]`
+    history_segment_records: int = config.getint('history', 'segment_records', fallback=100_000)
+    history_max_segments: int = config.getint('history', 'max_segments', fallback=20)
+    # how many of each user's latest rolls are indexed for /history
+    history_per_user: int = config.getint('history', 'per_user', fallback=100)
+
+    # Getting the variables from `[games]`
+    # seconds the tic-tac-toe bot gets to think about each move
+    ai_move_budget: float = config.getfloat('games', 'ai_move_budget', fallback=1.0)
+
 
 except Exception as err:
     print("Error getting variables from the config file. Error: " + str(err))  # no access to logger, use print
@@ -0,0 +1,364 @@
+"""
+The bot opponent for /game tictactoe.
+
+Moves are searched with negamax and alpha-beta pruning, deepening one move at a time until the per-move time
+budget runs out, so bigger boards still answer in time with the best move found so far. Positions are stored in a
+transposition table keyed by Zobrist hashes. A hash is kept for every symmetry of the board (rotations and
+reflections), and the smallest one is used as the key, so mirrored positions share their entries too.
+
+3x3 games are small enough to solve outright, so every 3x3 position's best moves are worked out once and
+saved to data/tictactoe_book.json, and the bot plays those instantly from then on.
+"""
+import json
+import random
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+from backend.config import ai_move_budget
+from backend.games.tictactoe import Board
+from backend.utils.logging import log
+
+BOOK_PATH = Path("data/tictactoe_book.json")
+BOOK_VERSION = 1
+
+# a win scores WIN plus the number of empty cells left, so quicker wins score higher. Heuristic scores stay far below it
+WIN = 1_000_000
+INFINITY = 2 * WIN
+# how much a line that only one player has marks in is worth, by how many marks it has
+LINE_WEIGHTS = (0, 1, 8, 64, 512, 4096)
+# the table is cleared when it gets bigger than this
+MAX_TABLE_SIZE = 500_000
+
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class _OutOfTime(Exception):
+    pass
+
+
+def _symmetries(width: int, height: int) -> list[list[int]]:
+    """
+    For each symmetry of the board, where every cell ends up. Non-square boards only have the four reflections.
+    """
+    transforms = [lambda x, y: (x, y), lambda x, y: (width - 1 - x, y),
+                  lambda x, y: (x, height - 1 - y), lambda x, y: (width - 1 - x, height - 1 - y)]
+    if width == height:
+        transforms += [lambda x, y: (y, x), lambda x, y: (width - 1 - y, x),
+                       lambda x, y: (y, height - 1 - x), lambda x, y: (width - 1 - y, height - 1 - x)]
+    permutations = []
+    for transform in transforms:
+        permutation = [0] * (width * height)
+        for y in range(height):
+            for x in range(width):
+                new_x, new_y = transform(x, y)
+                permutation[y * width + x] = new_y * width + new_x
+        permutations.append(permutation)
+    return permutations
+
+
+class Solver:
+    """
+    Searches one board size and row length. The transposition table is kept between moves and games.
+    """
+
+    def __init__(self, width: int, height: int, row: int):
+        self.width = width
+        self.height = height
+        self.row = row
+        self.cells = width * height
+        self.symmetries = _symmetries(width, height)
+        self.inverses = []
+        for permutation in self.symmetries:
+            inverse = [0] * self.cells
+            for cell, moved in enumerate(permutation):
+                inverse[moved] = cell
+            self.inverses.append(inverse)
+        # fixed seed, so the keys are the same every run
+        keys = random.Random(f"zobrist {width}x{height}")
+        self.zobrist = [None, [keys.getrandbits(64) for _ in range(self.cells)],
+                        [keys.getrandbits(64) for _ in range(self.cells)]]
+        masks = Board(width, height, row).masks
+        self.lines = sorted({mask for through in masks for mask in through})
+        # cells through more lines are usually better, so they're tried first
+        self.order = sorted(range(self.cells), key=lambda cell: -len(masks[cell]))
+        self.table = {}
+
+    def hashes(self, board: Board) -> list[int]:
+        """
+        The position's Zobrist hash under every symmetry.
+        """
+        hashes = [0] * len(self.symmetries)
+        for cell, mark in enumerate(board.cells):
+            if mark != Board.EMPTY:
+                for index, permutation in enumerate(self.symmetries):
+                    hashes[index] ^= self.zobrist[mark][permutation[cell]]
+        return hashes
+
+    def best_moves(self, board: Board, mark: int, budget: Optional[float] = None) -> tuple[list[int], int]:
+        """
+        Searches for `mark`'s best moves within `budget` seconds (or until it's solved, if there's no budget).
+        Returns every move that scored best in the deepest search that finished, and that score.
+        """
+        if len(self.table) > MAX_TABLE_SIZE:
+            self.table = {}
+        deadline = None if budget is None else time.perf_counter() + budget
+        search = _Search(self, board.copy(), deadline)
+        empties = [cell for cell in self.order if board.cells[cell] == Board.EMPTY]
+        random.shuffle(empties)
+        empties.sort(key=lambda cell: -len(board.masks[cell]))
+        moves, score = empties[:1], 0
+        for depth in range(1, len(empties) + 1):
+            try:
+                moves, score = search.root(empties, mark, depth)
+            except _OutOfTime:
+                break
+            # the next search starts with the best move of this one
+            empties.remove(moves[0])
+            empties.insert(0, moves[0])
+            # a win can be proven through the table before this depth is enough to find every other move as quick,
+            # so it only stops once the search reaches that far. Losing is only best once every move is proven to lose
+            if score <= -WIN or score >= WIN and depth >= len(empties) - (score - WIN):
+                break
+        return moves, score
+
+    def best_move(self, board: Board, mark: int, budget: Optional[float] = None) -> tuple[int, int]:
+        moves, _ = self.best_moves(board, mark, budget)
+        y, x = divmod(random.choice(moves), self.width)
+        return x, y
+
+
+class _Search:
+    """
+    The state of one search: its own copy of the board, its hashes, and when it has to stop.
+    """
+
+    def __init__(self, solver: Solver, board: Board, deadline: Optional[float]):
+        self.solver = solver
+        self.board = board
+        self.deadline = deadline
+        self.hashes = solver.hashes(board)
+        self.empty = sum(mark == Board.EMPTY for mark in board.cells)
+        self.nodes = 0
+
+    def _place(self, cell: int, mark: int) -> Optional[int]:
+        for index, permutation in enumerate(self.solver.symmetries):
+            self.hashes[index] ^= self.solver.zobrist[mark][permutation[cell]]
+        self.empty -= 1
+        y, x = divmod(cell, self.board.width)
+        return self.board.place(x, y, mark)
+
+    def _remove(self, cell: int, mark: int):
+        for index, permutation in enumerate(self.solver.symmetries):
+            self.hashes[index] ^= self.solver.zobrist[mark][permutation[cell]]
+        self.empty += 1
+        y, x = divmod(cell, self.board.width)
+        self.board.remove(x, y)
+
+    def _evaluate(self, mark: int) -> int:
+        """
+        A guess at how good the position is for `mark`, from the lines each player could still complete.
+        """
+        mine, theirs = self.board.bitboards[mark], self.board.bitboards[3 - mark]
+        score = 0
+        for line in self.solver.lines:
+            if line & theirs == 0:
+                score += LINE_WEIGHTS[min((line & mine).bit_count(), 5)]
+            elif line & mine == 0:
+                score -= LINE_WEIGHTS[min((line & theirs).bit_count(), 5)]
+        return score
+
+    def _moves(self, first: Optional[int]) -> list[int]:
+        cells = self.board.cells
+        moves = [cell for cell in self.solver.order if cells[cell] == Board.EMPTY]
+        if first is not None and first in moves:
+            moves.remove(first)
+            moves.insert(0, first)
+        return moves
+
+    def _unique(self, moves: list[int], mark: int) -> list[int]:
+        """
+        On a symmetric board, moves that are mirror images of each other lead to the same position,
+        so only one of each is searched.
+        """
+        if self.hashes.count(self.hashes[0]) == 1:
+            return moves
+        seen = set()
+        unique = []
+        keys = self.solver.zobrist[mark]
+        for cell in moves:
+            child = min(value ^ keys[permutation[cell]]
+                        for value, permutation in zip(self.hashes, self.solver.symmetries))
+            if child not in seen:
+                seen.add(child)
+                unique.append(cell)
+        return unique
+
+    def _score(self, cell: int, mark: int, depth: int, alpha: int, beta: int) -> int:
+        result = self._place(cell, mark)
+        if result == mark:
+            score = WIN + self.empty
+        elif result == Board.TIE:
+            score = 0
+        else:
+            score = -self.negamax(3 - mark, depth - 1, -beta, -alpha)
+        self._remove(cell, mark)
+        return score
+
+    def negamax(self, mark: int, depth: int, alpha: int, beta: int) -> int:
+        self.nodes += 1
+        if self.deadline is not None and self.nodes & 1023 == 0 and time.perf_counter() > self.deadline:
+            raise _OutOfTime()
+        # past this many moves the board is full, so a search that deep is exact
+        depth = min(depth, self.empty)
+        key = min(self.hashes)
+        symmetry = self.hashes.index(key)
+        entry = self.solver.table.get(key)
+        first = None
+        if entry is not None:
+            entry_depth, value, flag, move = entry
+            if move is not None:
+                first = self.solver.inverses[symmetry][move]
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+        if depth == 0:
+            return self._evaluate(mark)
+
+        original_alpha = alpha
+        best, best_move = -INFINITY, None
+        for cell in self._unique(self._moves(first), mark):
+            score = self._score(cell, mark, depth, alpha, beta)
+            if score > best:
+                best, best_move = score, cell
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+        flag = UPPER if best <= original_alpha else LOWER if best >= beta else EXACT
+        self.solver.table[key] = (depth, best, flag, self.solver.symmetries[symmetry][best_move])
+        return best
+
+    def root(self, moves: list[int], mark: int, depth: int) -> tuple[list[int], int]:
+        """
+        Scores every move to `depth`. Moves are searched with a window that only tells apart the ones as good as
+        the best so far, which is still enough to find all of the best moves.
+        """
+        best, best_moves = -INFINITY, []
+        for cell in moves:
+            score = self._score(cell, mark, depth, best - 1, INFINITY)
+            if score > best:
+                best, best_moves = score, [cell]
+            elif score == best:
+                best_moves.append(cell)
+        return best_moves, best
+
+
+@lru_cache(maxsize=None)
+def solver_for(width: int, height: int, row: int) -> Solver:
+    return Solver(width, height, row)
+
+
+class OpeningBook:
+    """
+    The best moves for every 3x3 position, stored once per set of mirror images.
+    Positions are written as 9 characters, "X", "O" or ".", row by row.
+    """
+
+    def __init__(self, path: Path = BOOK_PATH):
+        self.path = Path(path)
+        self.positions: Optional[dict[str, list[int]]] = None
+        self.symmetries = _symmetries(3, 3)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(cells) -> str:
+        return "".join(".XO"[mark] for mark in cells)
+
+    def _canonical(self, cells) -> tuple[str, list[int]]:
+        """
+        The smallest key among the position's mirror images, and the symmetry that gives it.
+        """
+        best = None
+        for permutation in self.symmetries:
+            moved = [0] * 9
+            for cell, mark in enumerate(cells):
+                moved[permutation[cell]] = mark
+            key = self._key(moved)
+            if best is None or key < best[0]:
+                best = (key, permutation)
+        return best
+
+    def _build(self) -> dict[str, list[int]]:
+        solver = Solver(3, 3, 3)
+        positions = {}
+        started = time.perf_counter()
+
+        def visit(board: Board, mark: int):
+            key, permutation = self._canonical(board.cells)
+            if key in positions:
+                return
+            # the moves are stored as they'd be played on the canonical position
+            moves, _ = solver.best_moves(board, mark)
+            positions[key] = sorted(permutation[move] for move in moves)
+            for cell in range(9):
+                if board.cells[cell] == Board.EMPTY:
+                    y, x = divmod(cell, 3)
+                    if board.place(x, y, mark) is None:
+                        visit(board, 3 - mark)
+                    board.remove(x, y)
+
+        visit(Board(3, 3, 3), Board.X)
+        log.info(f"Built the 3x3 opening book ({len(positions)} positions) in {time.perf_counter() - started:.2f}s")
+        return positions
+
+    def load(self):
+        with self._lock:
+            if self.positions is not None:
+                return
+            try:
+                with open(self.path) as file:
+                    saved = json.load(file)
+                if saved.get("version") == BOOK_VERSION:
+                    self.positions = saved["positions"]
+                    return
+            except (FileNotFoundError, ValueError):
+                pass
+            self.positions = self._build()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = self.path.with_name(self.path.name + ".tmp")
+            with open(temporary, "w") as file:
+                json.dump({"version": BOOK_VERSION, "positions": self.positions}, file)
+            temporary.replace(self.path)
+
+    def moves(self, board: Board) -> list[int]:
+        """
+        The best moves in a 3x3 position, as cells of the board as it is.
+        """
+        self.load()
+        key, permutation = self._canonical(board.cells)
+        inverse = {moved: cell for cell, moved in enumerate(permutation)}
+        return [inverse[move] for move in self.positions.get(key, ())]
+
+
+opening_book = OpeningBook()
+
+
+def choose_move(board: Board, mark: int, budget: float = ai_move_budget) -> tuple[int, int]:
+    """
+    Picks the bot's move. This blocks for up to `budget` seconds, so it should be run in a thread.
+    """
+    if (board.width, board.height, board.row) == (3, 3, 3):
+        moves = opening_book.moves(board)
+        if moves:
+            y, x = divmod(random.choice(moves), 3)
+            return x, y
+    return solver_for(board.width, board.height, board.row).best_move(board, mark, budget)
@@ -1,7 +1,197 @@
-from typing import List
+import asyncio
+from functools import lru_cache
+from string import ascii_uppercase
+from typing import Callable, List, Optional
 
 import discord
 
+# The board is stored as one integer bitboard per player, where cell (x, y) is bit `y * width + x`.
+# A player has won when one of their bitboard's lines of `row` cells is all set.
+
+
+@lru_cache(maxsize=None)
+def line_masks(width: int, height: int, row: int) -> tuple:
+    """
+    For every cell, the bitmasks of every line of `row` cells that goes through it
+    (across, down, and both diagonals). Only lines through the last move can have just been completed,
+    so these are all a win check needs to look at.
+    """
+    through = [[] for _ in range(width * height)]
+    for dx, dy in ((1, 0), (0, 1), (1, 1), (1, -1)):
+        for y in range(height):
+            for x in range(width):
+                end_x, end_y = x + dx * (row - 1), y + dy * (row - 1)
+                if not (0 <= end_x < width and 0 <= end_y < height):
+                    continue
+                cells = [(y + dy * i) * width + x + dx * i for i in range(row)]
+                mask = sum(1 << cell for cell in cells)
+                for cell in cells:
+                    through[cell].append(mask)
+    return tuple(tuple(masks) for masks in through)
+
+
+# /game tictactoe allows 3x3 to 5x5 boards, so their masks are worked out up front
+for _size in range(3, 6):
+    for _row in range(3, _size + 1):
+        line_masks(_size, _size, _row)
+
+
+class Board:
+    """
+    An m,n,k game: a `width` by `height` board, won by getting `row` marks in a line.
+    `cells` holds one byte per cell (EMPTY, X or O) for looking cells up and drawing the board,
+    and `bitboards` holds each player's marks as bits for checking wins.
+    """
+    EMPTY = 0
+    X = 1
+    O = 2
+    TIE = 3
+
+    def __init__(self, width: int, height: int, row: int):
+        self.width = width
+        self.height = height
+        self.row = row
+        self.cells = bytearray(width * height)
+        self.bitboards = [0, 0, 0]
+        self.full = (1 << (width * height)) - 1
+        self.masks = line_masks(width, height, row)
+        self.last_move = None
+
+    def __getitem__(self, position: tuple[int, int]) -> int:
+        x, y = position
+        return self.cells[y * self.width + x]
+
+    def is_taken(self, x: int, y: int) -> bool:
+        return self.cells[y * self.width + x] != self.EMPTY
+
+    def place(self, x: int, y: int, mark: int) -> Optional[int]:
+        """
+        Places a mark, returning the result if it ended the game: the winner's mark or TIE.
+        """
+        cell = y * self.width + x
+        self.cells[cell] = mark
+        self.bitboards[mark] |= 1 << cell
+        self.last_move = (x, y)
+        # only a line through the last move can have just been completed
+        bitboard = self.bitboards[mark]
+        if any(bitboard & mask == mask for mask in self.masks[cell]):
+            return mark
+        if self.bitboards[self.X] | self.bitboards[self.O] == self.full:
+            return self.TIE
+        return None
+
+    def remove(self, x: int, y: int):
+        """
+        Takes a mark back off the board, for searching through moves. `last_move` isn't restored.
+        """
+        cell = y * self.width + x
+        self.bitboards[self.cells[cell]] &= ~(1 << cell)
+        self.cells[cell] = self.EMPTY
+
+    def copy(self) -> "Board":
+        board = Board.__new__(Board)
+        board.__dict__.update(self.__dict__)
+        board.cells = bytearray(self.cells)
+        board.bitboards = list(self.bitboards)
+        return board
+
+    def render(self) -> str:
+        """
+        The whole board as text, with lettered columns and numbered rows.
+        """
+        marks = {self.EMPTY: "·", self.X: "X", self.O: "O"}
+        number_width = len(str(self.height))
+        lines = [" " * number_width + " " + " ".join(ascii_uppercase[:self.width])]
+        for y in range(self.height):
+            lines.append(f"{y + 1:>{number_width}} " +
+                         " ".join(marks[mark] for mark in self.cells[y * self.width:(y + 1) * self.width]))
+        return "\n".join(lines)
+
+
+class BoardGame(discord.ui.View):
+    """
+    The turn taking shared by every board game view. X moves first; whoever makes the first move of each mark
+    becomes its player. Subclasses decide how the board is shown, through `render` and `content`.
+    With an `opponent`, the bot plays O: it's called with a copy of the board and O, and returns O's move.
+    """
+    X = Board.X
+    O = Board.O
+    Tie = Board.TIE
+
+    def __init__(self, width: int, height: int, row: int,
+                 opponent: Optional[Callable[[Board, int], tuple[int, int]]] = None):
+        super().__init__()
+        self.board = Board(width, height, row)
+        self.current_player = self.X
+        self.players = [None, None]
+        self.finished = False
+        self.opponent = opponent
+
+    def render(self):
+        pass
+
+    def content(self, status: str) -> str:
+        return status
+
+    async def play(self, interaction: discord.Interaction, x: int, y: int):
+        if self.board.is_taken(x, y):
+            return
+        if self.opponent is not None and self.current_player == self.O:
+            await interaction.response.send_message("Wait for the bot's move!", ephemeral=True)
+            return
+        if self.opponent is not None and self.players[1] is None:
+            # O's seat is taken up front, so nobody else can sit down while the bot thinks
+            self.players[1] = interaction.client.user
+        seat = 0 if self.current_player == self.X else 1
+        if self.players[seat] is None:
+            self.players[seat] = interaction.user
+        elif interaction.user != self.players[seat]:
+            if interaction.user == self.players[1 - seat]:
+                await interaction.response.send_message("It's not your turn!", ephemeral=True)
+            else:
+                await interaction.response.send_message(f"{self.players[seat].mention} and {self.players[1 - seat].mention} are already playing! Please wait for another game.", ephemeral=True)
+            return
+
+        status = self.move(x, y)
+        self.render()
+        await interaction.response.edit_message(content=self.content(status), view=self)
+
+        if self.opponent is not None and not self.finished:
+            # the search takes up to its whole time budget, so it's kept off the event loop
+            x, y = await asyncio.to_thread(self.opponent, self.board.copy(), self.O)
+            status = self.move(x, y)
+            self.render()
+            await interaction.edit_original_response(content=self.content(status), view=self)
+
+    def move(self, x: int, y: int) -> str:
+        """
+        Places the current player's mark and passes the turn, returning the game's new status.
+        """
+        winner = self.board.place(x, y, self.current_player)
+        self.current_player = self.O if self.current_player == self.X else self.X
+        status = "It's now O's turn." if self.current_player == self.O else "It's now X's turn."
+        if winner is not None:
+            if winner == self.X:
+                status = f'X ({self.players[0].display_name}) won!'
+            elif winner == self.O:
+                status = f'O ({self.players[1].display_name}) won!'
+            else:
+                status = "It's a tie!"
+            self.finished = True
+            self.stop()
+        return status
+
+    @staticmethod
+    def style_cell(button: discord.ui.Button, mark: int, finished: bool, empty_label: str = '\u200b'):
+        if mark == Board.X:
+            button.style, button.label = discord.ButtonStyle.danger, 'X'
+        elif mark == Board.O:
+            button.style, button.label = discord.ButtonStyle.primary, 'O'
+        else:
+            button.style, button.label = discord.ButtonStyle.secondary, empty_label
+        button.disabled = finished or mark != Board.EMPTY
+
+
 # Defines a custom button that contains the logic of the game.
 # The ['TicTacToe'] bit is for type hinting purposes to tell your IDE or linter
 # what the type of `self.view` is. It is not required.
@@ -16,79 +206,20 @@ class TicTacToeButton(discord.ui.Button['TicTacToe']):
         self.y = y
 
     # This function is called whenever this particular button is pressed
-    # This is part of the "meat" of the game logic
     async def callback(self, interaction: discord.Interaction):
         assert self.view is not None
-        view: TicTacToe = self.view
-        state = view.board[self.y][self.x]
-        if state in (view.X, view.O):
-            return
-
-        if view.current_player == view.X:
-            if view.players[0] is None:
-                view.players[0] = interaction.user
-            else:
-                if interaction.user != view.players[0]:
-                    if interaction.user == view.players[1]:
-                        await interaction.response.send_message("It's not your turn!",ephemeral=True)
-                    else:
-                        await interaction.response.send_message(f"{view.players[0].mention} and {view.players[1].mention} are already playing! Please wait for another game.", ephemeral=True)
-                    return
-            self.style = discord.ButtonStyle.danger
-            self.label = 'X'
-            self.disabled = True
-            view.board[self.y][self.x] = view.X
-            view.current_player = view.O
-            content = "It's now O's turn."
-        else:
-            if view.players[1] is None:
-                view.players[1] = interaction.user
-            else:
-                if interaction.user != view.players[1]:
-                    if interaction.user == view.players[0]:
-                        await interaction.response.send_message("It's not your turn!",ephemeral=True)
-                    else:
-                        await interaction.response.send_message(f"{view.players[1].mention} and {view.players[0].mention} are already playing! Please wait for another game.", ephemeral=True)
-                    return
-            self.style = discord.ButtonStyle.primary
-            self.label = 'O'
-            self.disabled = True
-            view.board[self.y][self.x] = view.O
-            view.current_player = view.X
-            content = "It's now X's turn."
-
-        winner = view.check_board_winner()
-        if winner is not None:
-            if winner == view.X:
-                content = f'X ({view.players[0].global_name}) won!'
-            elif winner == view.O:
-                content = f'O ({view.players[1].global_name}) won!'
-            else:
-                content = "It's a tie!"
-
-            for child in view.children:
-                child.disabled = True
-
-            view.stop()
+        await self.view.play(interaction, self.x, self.y)
 
-        await interaction.response.edit_message(content=content, view=view)
 
-
-class TicTacToe(discord.ui.View):
+class TicTacToe(BoardGame):
     # This tells the IDE or linter that all our children will be TicTacToeButtons
     # This is not required
     children: List[TicTacToeButton]
-    X = -1
-    O = 1
-    Tie = 2
 
-    def __init__(self, size, row):
-        super().__init__()
+    def __init__(self, size, row, opponent=None):
+        super().__init__(size, size, row, opponent)
         self.size = size
-        self.current_player = self.X
-        self.board = [x[:] for x in [[0] * size] * size]
         self.row = row
-        self.players = [None, None]
 
         # Our board is made up of 3-5 by 3-5 TicTacToeButtons
         # The TicTacToeButton maintains the callbacks and helps steer
@@ -97,39 +228,90 @@ class TicTacToe(discord.ui.View):
             for y in range(size):
                 self.add_item(TicTacToeButton(x, y))
 
-    # This method checks for the board winner -- it is used by the TicTacToeButton
-    def check_board_winner(self):
-        """Returns the 'mark' of the player with a row of the given length."""
-        width = range(len(self.board))
-        height = range(len(self.board[0]))
-        # Do four scans across the board -- right, down, and diagonals.
-        for dx, dy in [(0, 1), (1, 0), (1, 1), (1, -1)]:
-            edges = []
-            if dx > 0:
-                # scanning right, start from left edge
-                edges += [(0, y) for y in height]
-            if dy > 0:
-                # scanning down, start from top edge
-                edges += [(x, 0) for x in width]
-            if dy < 0:
-                # scanning up, start from bottom edge
-                edges += [(x, height[-1]) for x in width]
-            for ex, ey in edges:
-                mark = 0
-                row = 0
-                x, y = ex, ey
-                while x in width and y in height:
-                    if self.board[x][y] == mark:
-                        row += 1
-                    else:
-                        mark = self.board[x][y]
-                        row = 1
-                    if mark != 0 and row >= self.row:
-                        return mark
-                    x, y = x + dx, y + dy
-
-        # If we're here, we need to check if a tie was made
-        if all(i != 0 for row in self.board for i in row):
-            return self.Tie
-
-        return None
\ No newline at end of file
+    def render(self):
+        for child in self.children:
+            self.style_cell(child, self.board[child.x, child.y], self.finished)
+
+
+# A view has 5 rows of 5 buttons; bigger boards show a window of 4 rows, with the last row for moving it around
+VIEWPORT_WIDTH = 5
+VIEWPORT_HEIGHT = 4
+
+
+class ViewportButton(discord.ui.Button['MNKGame']):
+    """
+    One cell of the window. Which cell of the board it is depends on where the window is.
+    """
+
+    def __init__(self, column: int, row: int):
+        super().__init__(style=discord.ButtonStyle.secondary, label='\u200b', row=row)
+        self.column = column
+        self.viewport_row = row
+
+    async def callback(self, interaction: discord.Interaction):
+        assert self.view is not None
+        view: MNKGame = self.view
+        await view.play(interaction, view.origin[0] + self.column, view.origin[1] + self.viewport_row)
+
+
+class PanButton(discord.ui.Button['MNKGame']):
+    def __init__(self, label: str, dx: int, dy: int):
+        super().__init__(style=discord.ButtonStyle.success, label=label, row=VIEWPORT_HEIGHT)
+        self.dx = dx
+        self.dy = dy
+
+    async def callback(self, interaction: discord.Interaction):
+        assert self.view is not None
+        view: MNKGame = self.view
+        if None not in view.players and interaction.user not in view.players:
+            await interaction.response.send_message("Only the players can move the board around!", ephemeral=True)
+            return
+        if self.dx == self.dy == 0:
+            view.center_on(*(view.board.last_move or (view.board.width // 2, view.board.height // 2)))
+        else:
+            # a step keeps one column/row of the old window in view, so it's easy to tell where you are
+            view.move_to(view.origin[0] + self.dx * (VIEWPORT_WIDTH - 1),
+                         view.origin[1] + self.dy * (VIEWPORT_HEIGHT - 1))
+        view.render()
+        await interaction.response.edit_message(content=view.content(view.status), view=view)
+
+
+class MNKGame(BoardGame):
+    """
+    An m,n,k game on a board of any size (gomoku is 15x15 with 5 in a row). The whole board is drawn as text,
+    and a 5x4 window of it can be played through buttons, with a row of buttons to move the window around.
+    Only those 25 buttons ever exist; they're relabelled from the board for wherever the window is.
+    """
+
+    def __init__(self, width: int, height: int, row: int):
+        super().__init__(width, height, row)
+        self.origin = (0, 0)
+        self.status = "Pick a place to start!"
+        self.cell_buttons = [ViewportButton(column, row) for row in range(min(VIEWPORT_HEIGHT, height))
+                             for column in range(min(VIEWPORT_WIDTH, width))]
+        for button in self.cell_buttons:
+            self.add_item(button)
+        for label, dx, dy in (("◀", -1, 0), ("▲", 0, -1), ("◎", 0, 0), ("▼", 0, 1), ("▶", 1, 0)):
+            self.add_item(PanButton(label, dx, dy))
+        self.center_on(width // 2, height // 2)
+        self.render()
+
+    def move_to(self, x: int, y: int):
+        self.origin = (min(max(x, 0), max(self.board.width - VIEWPORT_WIDTH, 0)),
+                       min(max(y, 0), max(self.board.height - VIEWPORT_HEIGHT, 0)))
+
+    def center_on(self, x: int, y: int):
+        self.move_to(x - VIEWPORT_WIDTH // 2, y - VIEWPORT_HEIGHT // 2)
+
+    def render(self):
+        for button in self.cell_buttons:
+            x, y = self.origin[0] + button.column, self.origin[1] + button.viewport_row
+            self.style_cell(button, self.board[x, y], self.finished, f"{ascii_uppercase[x]}{y + 1}")
+
+    def content(self, status: str) -> str:
+        self.status = status
+        last_x = min(self.origin[0] + VIEWPORT_WIDTH, self.board.width) - 1
+        last_y = min(self.origin[1] + VIEWPORT_HEIGHT, self.board.height) - 1
+        return f"{status} ({self.board.row} in a row wins)\n```\n{self.board.render()}\n```\n" \
+               f"Buttons show {ascii_uppercase[self.origin[0]]}{self.origin[1] + 1}–" \
+               f"{ascii_uppercase[last_x]}{last_y + 1}."
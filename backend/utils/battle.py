@@ -1,4 +1,11 @@
-from random import uniform
+import random
+import time
+
+from backend.config import battle_sim_budget, battle_sim_chunk, battle_sim_noise
+from backend.utils.lazy import lazy_import
+
+numpy = lazy_import("numpy")
+
 def lanchester(a, b, ar, br, e):
     if a > b:
         winner, loser = a, b
@@ -12,12 +19,136 @@ def lanchester(a, b, ar, br, e):
     else:
         return 1, retreat*a, (ratio*retreat**e-ratio+1)**(1/e)*b
 
-def casualties(a, b, loss):
+def casualties(a, b, loss, rng=random):
     if loss is None:
-        loss = uniform(1 / 3, 2 / 3)
+        loss = rng.uniform(1 / 3, 2 / 3)
     exponent = 1.5 #shouldnt need to change this that much
     winner, a_left, b_left = lanchester(a,b,loss,loss,exponent)
     if winner: #b wins
         return f"Side B, as the winner, has {round(b_left)} soldiers remaining, and Side A drops to {round(a_left)}"
     else: #a wins
-        return f"Side A's victory leaves them with {round(a_left)} soldiers left, while Side B loses with {round(b_left)}"
\ No newline at end of file
+        return f"Side A's victory leaves them with {round(a_left)} soldiers left, while Side B loses with {round(b_left)}"
+
+
+def lanchester_array(a, b, ar, br, e):
+    """
+    `lanchester` over NumPy arrays (or anything that broadcasts), evaluating every battle at once.
+    Returns an array of winners (True where side B won) and the arrays of what's left of each side.
+    """
+    a_wins = a > b
+    winner = numpy.where(a_wins, a, b)
+    loser = numpy.where(a_wins, b, a)
+    retreat = numpy.where(a_wins, br, ar)
+    ratio = loser / winner
+    survivors = (ratio * retreat ** e - ratio + 1) ** (1 / e) * winner
+    return ~a_wins, numpy.where(a_wins, survivors, retreat * a), numpy.where(a_wins, retreat * b, survivors)
+
+
+class SimulationResult:
+    QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+    def __init__(self, trials: int, a_win_chance: float, a_quantiles: list[float], b_quantiles: list[float]):
+        self.trials = trials
+        self.a_win_chance = a_win_chance
+        self.a_quantiles = a_quantiles
+        self.b_quantiles = b_quantiles
+
+
+def simulate(a, b, trials: int, generator, budget: float = battle_sim_budget, exponent=(1.25, 1.75),
+             retreat=(1 / 3, 2 / 3), noise: float = battle_sim_noise, chunk: int = battle_sim_chunk) -> SimulationResult:
+    """
+    Runs a battle `trials` times with `lanchester_array`, drawing a new exponent, retreat ratio for each side
+    and strength for each side (a log-normal factor around the given strength) for every trial.
+    Trials run in chunks, and it stops after the chunk that uses up `budget` seconds of this thread's CPU time,
+    so it may run fewer trials than asked for. Needs NumPy.
+    """
+    start = time.thread_time()
+    b_wins, a_left, b_left = [], [], []
+    done = 0
+    while done < trials:
+        size = min(chunk, trials - done)
+        a_factor = generator.lognormal(0, noise, size)
+        b_factor = generator.lognormal(0, noise, size)
+        winners, a_chunk, b_chunk = lanchester_array(a * a_factor, b * b_factor,
+                                                     generator.uniform(*retreat, size),
+                                                     generator.uniform(*retreat, size),
+                                                     generator.uniform(*exponent, size))
+        # the survivors are in terms of each side's noisy strength, so scale them back to its real one
+        b_wins.append(winners)
+        a_left.append(a_chunk / a_factor)
+        b_left.append(b_chunk / b_factor)
+        done += size
+        if time.thread_time() - start >= budget:
+            break
+    a_left = numpy.concatenate(a_left)
+    b_left = numpy.concatenate(b_left)
+    return SimulationResult(done, 1 - float(numpy.concatenate(b_wins).mean()),
+                            numpy.quantile(a_left, SimulationResult.QUANTILES).tolist(),
+                            numpy.quantile(b_left, SimulationResult.QUANTILES).tolist())
+
+
+class BattleState:
+    """
+    Any number of sides fighting over a number of rounds, in one or many independent battles at once.
+
+    `strengths` has the sides on its last axis, so a 1D array is one battle and a 2D array is a batch of battles,
+    one per row. `retreat` (the share of a losing side that survives a round) and `exponent` are per side,
+    and broadcast against `strengths` the same way.
+
+    Each round, the strongest side wins (ties going to the later side, like `lanchester`). Every other side
+    retreats with `retreat` of its strength, and the winner takes a `lanchester` loss from each of them, scaled
+    by their strength against its own. With two sides, one round is exactly `lanchester`.
+    Needs NumPy.
+    """
+
+    def __init__(self, strengths, retreat=0.5, exponent=1.5):
+        self.strengths = numpy.array(strengths, dtype=float)
+        self.retreat = numpy.broadcast_to(numpy.asarray(retreat, dtype=float), self.strengths.shape)
+        exponent = numpy.asarray(exponent, dtype=float)
+        # with one exponent for everyone, a round has a closed form (see `_losses`)
+        self.shared_exponent = float(exponent.flat[0]) if exponent.size and (exponent == exponent.flat[0]).all() \
+            else None
+        self.exponent = numpy.broadcast_to(exponent, self.strengths.shape)
+        self.rounds = 0
+        # the winner of each round, for each battle
+        self.winners = []
+
+    @property
+    def sides(self) -> int:
+        return self.strengths.shape[-1]
+
+    def _losses(self, ratio, is_winner, winner):
+        """
+        The share of its strength the winner keeps after fighting every other side.
+        """
+        if self.shared_exponent is not None:
+            # lanchester's survival factor for each loser is (1 - ratio * (1 - retreat^e))^(1/e), and with a
+            # shared e the product of those is one root of one product
+            e = self.shared_exponent
+            terms = numpy.where(is_winner, 1.0, 1 - ratio * (1 - self.retreat ** e))
+            return terms.prod(axis=-1) ** (1 / e)
+        # otherwise each fight uses the average of the two sides' exponents, so each needs its own root
+        winner_exponent = numpy.take_along_axis(self.exponent, winner[..., None], axis=-1)
+        e = (self.exponent + winner_exponent) / 2
+        factors = numpy.where(is_winner, 1.0, (1 - ratio * (1 - self.retreat ** e)) ** (1 / e))
+        return factors.prod(axis=-1)
+
+    def step(self):
+        """
+        Fights one round, returning the index of the side that won it in each battle.
+        """
+        winner = self.sides - 1 - numpy.argmax(self.strengths[..., ::-1], axis=-1)
+        is_winner = numpy.arange(self.sides) == winner[..., None]
+        winner_strength = numpy.take_along_axis(self.strengths, winner[..., None], axis=-1)
+        ratio = numpy.divide(self.strengths, winner_strength, out=numpy.zeros_like(self.strengths),
+                             where=winner_strength > 0)
+        survivors = winner_strength[..., 0] * self._losses(ratio, is_winner, winner)
+        self.strengths = numpy.where(is_winner, survivors[..., None], self.retreat * self.strengths)
+        self.rounds += 1
+        self.winners.append(winner)
+        return winner
+
+    def run(self, rounds: int) -> "BattleState":
+        for _ in range(rounds):
+            self.step()
+        return self
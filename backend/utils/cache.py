@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    A bounded mapping that evicts its least recently used entry when it is full.
+    Keeps hit, miss and eviction counters so the cache can be checked on in production.
+    A maxsize of 0 disables caching entirely.
+
+    By default every entry counts as 1 towards `maxsize`. With `weigh`, an entry counts as `weigh(value)` instead,
+    so a cache of values that vary a lot in size can be bounded by their total size.
+    """
+
+    def __init__(self, maxsize: int = 128, weigh=None):
+        self.maxsize = max(maxsize, 0)
+        self.weigh = weigh or (lambda value: 1)
+        self.weight = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for a key (marking it as recently used), or `default` if it isn't cached.
+        """
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """
+        Caches a value, evicting the least recently used entries if the cache is over its size.
+        """
+        if self.maxsize == 0:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.weight -= self.weigh(self._entries[key])
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self.weight += self.weigh(value)
+            # a value too big for the whole cache evicts everything else, and then itself
+            while self.weight > self.maxsize and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.weight -= self.weigh(evicted)
+                self.evictions += 1
+
+    def get_or_create(self, key, factory):
+        """
+        Returns the cached value for a key, calling `factory(key)` and caching the result on a miss.
+        Exceptions raised by the factory are not cached.
+        """
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = factory(key)
+            self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.weight = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the cache's size and counters.
+        """
+        return {"size": len(self._entries), "weight": self.weight, "maxsize": self.maxsize,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
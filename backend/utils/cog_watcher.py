@@ -0,0 +1,74 @@
+import asyncio
+from pathlib import Path
+
+from discord.ext import commands
+
+from backend.utils.logging import log
+
+
+class CogWatcher:
+    """
+    Polls the cogs folder and hot-reloads cogs whose files changed, loads new ones and unloads deleted ones.
+    Only the cog modules are reloaded; everything under backend (and its caches) is left as it is.
+    """
+
+    def __init__(self, bot, directory: Path = Path("cogs"), interval: float = 1.0):
+        self.bot = bot
+        self.directory = Path(directory)
+        self.interval = interval
+        # what the files looked like when they were loaded
+        self._mtimes = self._scan()
+        self._task = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _scan(self) -> dict[str, int]:
+        return {path.stem: path.stat().st_mtime_ns for path in self.directory.glob("*.py")}
+
+    def start(self):
+        if not self.running:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def check(self) -> list[str]:
+        """
+        Reloads, loads or unloads whatever changed since the last check, returning a line about each.
+        """
+        mtimes = self._scan()
+        changes = []
+        for cog in sorted(mtimes.keys() | set(self.bot.coglist)):
+            try:
+                if cog not in mtimes:
+                    await self.bot.unload_cog(cog)
+                    changes.append(f"unloaded {cog}")
+                elif cog not in self.bot.coglist:
+                    # new, or broken the last time it was loaded
+                    if mtimes[cog] != self._mtimes.get(cog):
+                        await self.bot.load_cog(cog)
+                        changes.append(f"loaded {cog}")
+                elif mtimes[cog] != self._mtimes.get(cog):
+                    await self.bot.reload_cog(cog)
+                    changes.append(f"reloaded {cog}")
+            except commands.ExtensionError as err:
+                changes.append(f"failed to update {cog}: {err}")
+        self._mtimes = mtimes
+        return changes
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            changes = await self.check()
+            for change in changes:
+                (log.error if change.startswith("failed") else log.info)(f"Cog watcher: {change}")
+            if changes:
+                await self.bot.sync_commands()
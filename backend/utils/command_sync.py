@@ -0,0 +1,76 @@
+"""
+Syncs the app command tree only when it actually changed.
+
+Each scope (global, or one guild) is hashed from the same payload `CommandTree.sync` would send,
+and the hashes of the last successful syncs are kept in data/command_hashes.json, per application.
+On startup, only the scopes whose hash differs get synced, so an ordinary restart makes no sync requests at all.
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Optional
+
+import discord
+from discord import app_commands
+
+from backend.utils.logging import log
+
+HASH_PATH = Path("data/command_hashes.json")
+
+
+def _scope_name(guild: Optional[discord.abc.Snowflake]) -> str:
+    return "global" if guild is None else str(guild.id)
+
+
+def tree_hash(tree: app_commands.CommandTree, guild: Optional[discord.abc.Snowflake] = None) -> str:
+    """
+    A stable hash of the commands that would be synced to a scope. It doesn't depend on the order commands were added in.
+    """
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands(guild=guild)),
+                     key=lambda command: (command.get("type", 1), command["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def _load_hashes(path: Path) -> dict:
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def _save_hashes(path: Path, hashes: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(path.name + ".tmp")
+    with open(temporary, "w") as file:
+        json.dump(hashes, file, indent=2, sort_keys=True)
+    temporary.replace(path)
+
+
+async def sync_changed(tree: app_commands.CommandTree, guilds: list[Optional[discord.abc.Snowflake]],
+                       dry_run: bool = False, path: Path = HASH_PATH) -> list[str]:
+    """
+    Syncs each scope in `guilds` (None being the global scope) whose commands changed since its last sync,
+    and returns the names of the scopes that were (or, in a dry run, would be) synced.
+    A dry run only logs what it would do; it doesn't sync anything or touch the saved hashes.
+    """
+    hashes = _load_hashes(path)
+    application = str(tree.client.application_id)
+    saved = hashes.setdefault(application, {})
+    changed = []
+    for guild in guilds:
+        scope = _scope_name(guild)
+        digest = tree_hash(tree, guild)
+        if saved.get(scope) == digest:
+            log.info(f"Commands for {scope} are unchanged, not syncing")
+            continue
+        changed.append(scope)
+        if dry_run:
+            log.info(f"Commands for {scope} changed, would sync (dry run)")
+            continue
+        await tree.sync(guild=guild)
+        log.info(f"Commands for {scope} changed, synced")
+        # saved after every scope, so one failing doesn't make the others sync again next time
+        saved[scope] = digest
+        _save_hashes(path, hashes)
+    return changed
@@ -1,9 +1,15 @@
-import time
-
-from tinydb import TinyDB, Query
+import asyncio
+import copy
+import json
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Optional
+
+from backend.config import user_cache_size, flush_interval
+from backend.utils.logging import log
 
-userdb = TinyDB(Path("data/userdb.json"))
 
 class DatabaseError(LookupError):
     pass
@@ -21,9 +27,288 @@ class DatabasePermissionsError(DatabaseError):
     pass
 
 
-def create_new_user(discord_id: int):
-    User = Query()
-    if userdb.contains(User.id == discord_id):
-        raise AlreadyInDatabaseError
-    else:
-        userdb.insert({"id": discord_id})
\ No newline at end of file
+class UserStore:
+    """
+    The user database: one row per Discord user, keyed by their ID, with the rest of their data stored as JSON.
+
+    It's backed by SQLite in WAL mode. The ID is the table's primary key, so lookups use its index instead of
+    scanning, and writes only touch the rows they change. Every query runs on the store's own single thread,
+    so the event loop never waits on the disk and queries never race each other.
+    On first use, users from the old TinyDB file (`legacy_path`) are copied over and the file is renamed.
+    """
+
+    def __init__(self, path: Path, legacy_path: Optional[Path] = None):
+        self.path = Path(path)
+        self.legacy_path = Path(legacy_path) if legacy_path else None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="userdb")
+        self._connection = None
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        # opened on first use, on the store's thread, since a connection can only be used by the thread that made it
+        if self._connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # in WAL mode, this is still safe against corruption; at worst a crash loses the last few writes
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS users (id INTEGER PRIMARY KEY, data TEXT NOT NULL)")
+            if self.legacy_path is not None and self.legacy_path.exists():
+                try:
+                    self._migrate(connection)
+                except Exception:
+                    # left unset, so the migration is tried again on next use instead of being skipped for good
+                    connection.close()
+                    raise
+            self._connection = connection
+        return self._connection
+
+    def _migrate(self, connection: sqlite3.Connection):
+        """
+        Copies every user in the TinyDB file into the table, then renames the file so this only ever happens once.
+        An empty or unreadable file is treated as having no users.
+        """
+        with open(self.legacy_path) as legacy:
+            try:
+                documents = json.load(legacy).get("_default", {}).values()
+            except (json.JSONDecodeError, AttributeError) as err:
+                log.warning(f"{self.legacy_path} isn't a valid user database ({err}), so no users were migrated")
+                documents = []
+        rows = [(document.pop("id"), json.dumps(document)) for document in documents
+                if isinstance(document, dict) and "id" in document]
+        with _Transaction(connection):
+            connection.executemany("INSERT OR IGNORE INTO users (id, data) VALUES (?, ?)", rows)
+        self.legacy_path.rename(self.legacy_path.with_name(self.legacy_path.name + ".migrated"))
+        log.info(f"Migrated {len(rows)} users from {self.legacy_path} to {self.path}")
+
+    def transaction(self):
+        return _Transaction(self.connection)
+
+    async def run(self, function, *args):
+        """
+        Runs `function(*args)` on the store's thread. Anything that uses `connection` has to go through here.
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _get(self, discord_id: int) -> dict:
+        row = self.connection.execute("SELECT data FROM users WHERE id = ?", (discord_id,)).fetchone()
+        if row is None:
+            raise NotInDatabaseError
+        return {"id": discord_id, **json.loads(row[0])}
+
+    def _contains(self, discord_id: int) -> bool:
+        return self.connection.execute("SELECT 1 FROM users WHERE id = ?", (discord_id,)).fetchone() is not None
+
+    def _insert(self, discord_id: int, data: dict):
+        try:
+            self.connection.execute("INSERT INTO users (id, data) VALUES (?, ?)", (discord_id, json.dumps(data)))
+        except sqlite3.IntegrityError:
+            raise AlreadyInDatabaseError
+
+    def _update(self, discord_id: int, fields: dict) -> dict:
+        with self.transaction():
+            user = self._get(discord_id)
+            user.update(fields)
+            data = {key: value for key, value in user.items() if key != "id"}
+            self.connection.execute("UPDATE users SET data = ? WHERE id = ?", (json.dumps(data), discord_id))
+        return user
+
+    def _write_many(self, users: dict[int, dict]):
+        with self.transaction():
+            self.connection.executemany("INSERT OR REPLACE INTO users (id, data) VALUES (?, ?)",
+                                        [(discord_id, json.dumps(data)) for discord_id, data in users.items()])
+
+    async def get(self, discord_id: int) -> dict:
+        """
+        Returns a user's data (including their "id"). Raises NotInDatabaseError if they aren't in the database.
+        """
+        return await self.run(self._get, discord_id)
+
+    async def contains(self, discord_id: int) -> bool:
+        return await self.run(self._contains, discord_id)
+
+    async def insert(self, discord_id: int, data: Optional[dict] = None):
+        """
+        Adds a user. Raises AlreadyInDatabaseError if they're already in the database.
+        """
+        await self.run(self._insert, discord_id, data or {})
+
+    async def update(self, discord_id: int, fields: dict) -> dict:
+        """
+        Sets some of a user's fields, leaving the rest alone, and returns their updated data.
+        Raises NotInDatabaseError if they aren't in the database.
+        """
+        return await self.run(self._update, discord_id, fields)
+
+    async def write_many(self, users: dict[int, dict]):
+        """
+        Replaces the data of many users (added if needed) in one transaction.
+        """
+        await self.run(self._write_many, users)
+
+    def _close(self):
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    async def close(self):
+        await self.run(self._close)
+        self._executor.shutdown(wait=True)
+
+
+class _Transaction:
+    """
+    BEGIN ... COMMIT around a block, rolling back if it raises. Transactions don't nest.
+    """
+
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self):
+        self.connection.execute("BEGIN")
+        return self.connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+class UserCache:
+    """
+    A write-behind cache in front of a UserStore, with the same async API.
+
+    Reads are served from memory once a user has been loaded, and writes only change the cached copy and mark
+    the user dirty; however many times a user changes, they're written once per flush. Dirty users are written
+    in one transaction every `flush_interval` seconds (once `start` is called) and on `close`.
+    At most `maxsize` users are kept; the least recently used clean ones are dropped first, and dirty ones
+    are only dropped once they've been written, so the cache can briefly run over between flushes.
+    """
+
+    def __init__(self, store: UserStore, maxsize: int = user_cache_size, interval: float = flush_interval):
+        self.store = store
+        self.maxsize = maxsize
+        self.interval = interval
+        # None marks a user that is known not to be in the database
+        self._users: OrderedDict[int, Optional[dict]] = OrderedDict()
+        self._dirty = set()
+        self._task = None
+
+    def _remember(self, discord_id: int, user: Optional[dict]):
+        self._users[discord_id] = user
+        self._users.move_to_end(discord_id)
+        self._trim()
+
+    def _trim(self):
+        if len(self._users) <= self.maxsize:
+            return
+        # the most recent user is always kept, since whoever loaded it is about to use it
+        for discord_id in list(self._users)[:-1]:
+            if discord_id not in self._dirty:
+                del self._users[discord_id]
+                if len(self._users) <= self.maxsize:
+                    return
+
+    async def _load(self, discord_id: int) -> Optional[dict]:
+        if discord_id in self._users:
+            self._users.move_to_end(discord_id)
+            return self._users[discord_id]
+        try:
+            user = await self.store.get(discord_id)
+        except NotInDatabaseError:
+            user = None
+        # it may have been loaded or changed while the store was being read
+        if discord_id in self._users:
+            return self._users[discord_id]
+        self._remember(discord_id, user)
+        return user
+
+    async def get(self, discord_id: int) -> dict:
+        """
+        Returns a copy of a user's data (including their "id"). Raises NotInDatabaseError if they aren't in the database.
+        """
+        user = await self._load(discord_id)
+        if user is None:
+            raise NotInDatabaseError
+        # a deep copy, so changing a nested value can't change the cached user behind the cache's back
+        return copy.deepcopy(user)
+
+    async def contains(self, discord_id: int) -> bool:
+        return await self._load(discord_id) is not None
+
+    async def insert(self, discord_id: int, data: Optional[dict] = None):
+        """
+        Adds a user. Raises AlreadyInDatabaseError if they're already in the database.
+        """
+        if await self._load(discord_id) is not None:
+            raise AlreadyInDatabaseError
+        self._dirty.add(discord_id)
+        self._remember(discord_id, {"id": discord_id, **copy.deepcopy(data or {})})
+
+    async def update(self, discord_id: int, fields: dict) -> dict:
+        """
+        Sets some of a user's fields, leaving the rest alone, and returns their updated data.
+        Raises NotInDatabaseError if they aren't in the database.
+        """
+        user = await self._load(discord_id)
+        if user is None:
+            raise NotInDatabaseError
+        user.update(copy.deepcopy(fields))
+        user["id"] = discord_id
+        self._dirty.add(discord_id)
+        return copy.deepcopy(user)
+
+    async def flush(self):
+        """
+        Writes every dirty user to the store in one transaction.
+        """
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        # snapshotted here, since the users can change again while the store's thread is writing them
+        users = {discord_id: {key: copy.deepcopy(value) for key, value in self._users[discord_id].items() if key != "id"}
+                 for discord_id in dirty}
+        try:
+            await self.store.write_many(users)
+        except Exception:
+            # keep them dirty, so the next flush tries again
+            self._dirty |= dirty
+            raise
+        self._trim()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as err:
+                log.error(f"Couldn't write users to the database: {err}")
+
+    def start(self):
+        """
+        Starts flushing on an interval. Has to be called from inside the running event loop.
+        """
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        """
+        Stops the flushing task, writes whatever is left, and closes the store.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        finally:
+            await self.store.close()
+
+
+user_store = UserStore(Path("data/userdb.sqlite3"), legacy_path=Path("data/userdb.json"))
+userdb = UserCache(user_store)
+
+
+async def create_new_user(discord_id: int):
+    await userdb.insert(discord_id)
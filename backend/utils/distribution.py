@@ -0,0 +1,374 @@
+"""
+Exact probability distributions for roll expressions.
+
+Every die in a RollPlan is `a * U + b`, where U is uniform over the dice range and a, b come from its modifiers.
+Dice are grouped by their scale `a`; each group's sum is a power of the uniform PMF (one FFT for big groups),
+and the groups are convolved together on a shared lattice. Nothing is ever enumerated roll by roll.
+"""
+import asyncio
+import math
+from fractions import Fraction
+
+from rollplayerlib import RollException
+
+from backend.config import distribution_cache_points, distribution_max_support
+from backend.utils.cache import LRUCache
+from backend.utils.lazy import lazy_import
+
+# only actually imported the first time it's used
+numpy = lazy_import("numpy")
+
+# below this many points, exact convolution beats the FFT (and is free of its rounding noise)
+_FFT_THRESHOLD = 4096
+# without NumPy every convolution is quadratic, so the pure Python engine is kept to much smaller results
+_MAX_SUPPORT_WITHOUT_NUMPY = 20_000
+# and the most possible results a distribution can have to be built on the event loop (a few milliseconds)
+_INLINE_SUPPORT_WITHOUT_NUMPY = 500
+# how many distributions can be built in the background at once
+_MAX_WARMING = 2
+
+
+def _fraction(number) -> Fraction:
+    # modifiers are parsed as floats, so keep "0.1" from becoming 3602879701896397/36028797018963968
+    return Fraction(number).limit_denominator(1_000_000)
+
+
+def _affine(operations) -> tuple[Fraction, Fraction]:
+    """
+    Folds a chain of operations into `(a, b)` such that applying them to x gives `a * x + b`.
+    """
+    scale, shift = Fraction(1), Fraction(0)
+    for operation, amount in operations:
+        amount = _fraction(amount)
+        if operation == "+":
+            shift += amount
+        elif operation == "-":
+            shift -= amount
+        elif operation == "*":
+            scale, shift = scale * amount, shift * amount
+        elif operation == "/":
+            if amount == 0:
+                raise RollException("Can't divide by zero.")
+            scale, shift = scale / amount, shift / amount
+    return scale, shift
+
+
+def _convolve(first, second):
+    if numpy is not None:
+        if len(first) + len(second) > _FFT_THRESHOLD:
+            size = len(first) + len(second) - 1
+            fft_size = 1 << (size - 1).bit_length()
+            return numpy.fft.irfft(numpy.fft.rfft(first, fft_size) * numpy.fft.rfft(second, fft_size), fft_size)[:size]
+        return numpy.convolve(first, second)
+    result = [0.0] * (len(first) + len(second) - 1)
+    for i, x in enumerate(first):
+        if x:
+            for j, y in enumerate(second):
+                result[i + j] += x * y
+    return result
+
+
+def _power(pmf, count: int):
+    """
+    The PMF of the sum of `count` independent copies of `pmf`.
+    """
+    size = (len(pmf) - 1) * count + 1
+    if numpy is not None and size > _FFT_THRESHOLD:
+        fft_size = 1 << (size - 1).bit_length()
+        return numpy.fft.irfft(numpy.fft.rfft(pmf, fft_size) ** count, fft_size)[:size]
+    # exponentiation by squaring
+    result = [1.0]
+    while count:
+        if count & 1:
+            result = _convolve(result, pmf)
+        count >>= 1
+        if count:
+            pmf = _convolve(pmf, pmf)
+    return result
+
+
+def _stretch(pmf, stride: int):
+    """
+    Spreads a PMF out so consecutive points are `stride` lattice steps apart.
+    """
+    if stride == 1:
+        return pmf
+    if numpy is not None:
+        stretched = numpy.zeros((len(pmf) - 1) * stride + 1)
+        stretched[::stride] = pmf
+        return stretched
+    stretched = [0.0] * ((len(pmf) - 1) * stride + 1)
+    stretched[::stride] = pmf
+    return stretched
+
+
+def _clean(pmf):
+    # the FFT leaves tiny negative noise in the tails
+    if numpy is not None:
+        # kept as a float64 array: a list of Python floats takes about 4 times the memory
+        pmf = numpy.clip(numpy.asarray(pmf, dtype=numpy.float64), 0, None)
+        return pmf / pmf.sum()
+    total = sum(pmf)
+    return [max(p, 0.0) / total for p in pmf]
+
+
+class Distribution:
+    """
+    A discrete distribution over the evenly spaced values `offset + k * step`, where `pmf[k]` is the chance of each.
+    The PMF and CDF are NumPy arrays if NumPy is installed, and lists otherwise.
+    """
+
+    def __init__(self, offset: Fraction, step: Fraction, pmf):
+        self.offset = offset
+        self.step = step
+        self.pmf = pmf
+        self._cdf = None
+        self._moments = None
+        self._rank_variance = None
+
+    def __len__(self):
+        return len(self.pmf)
+
+    def value(self, index: int) -> float:
+        return float(self.offset + index * self.step)
+
+    @property
+    def minimum(self) -> float:
+        return self.value(0)
+
+    @property
+    def maximum(self) -> float:
+        return self.value(len(self.pmf) - 1)
+
+    @property
+    def cdf(self):
+        """
+        The cumulative distribution, `cdf[k]` being the chance of rolling at most `value(k)`. Built once, on first use.
+        """
+        if self._cdf is None:
+            if numpy is not None:
+                self._cdf = numpy.minimum(numpy.cumsum(self.pmf), 1.0)
+            else:
+                self._cdf = list(_accumulate(self.pmf))
+        return self._cdf
+
+    def _index_moments(self) -> tuple[float, float]:
+        # mean and variance of the lattice index, from which the value's follow
+        if self._moments is None:
+            if numpy is not None:
+                pmf = numpy.asarray(self.pmf)
+                indices = numpy.arange(len(pmf))
+                mean = float(indices @ pmf)
+                self._moments = mean, float(((indices - mean) ** 2) @ pmf)
+            else:
+                mean = sum(k * p for k, p in enumerate(self.pmf))
+                self._moments = mean, sum((k - mean) ** 2 * p for k, p in enumerate(self.pmf))
+        return self._moments
+
+    @property
+    def mean(self) -> float:
+        return float(self.offset) + float(self.step) * self._index_moments()[0]
+
+    @property
+    def variance(self) -> float:
+        return float(self.step) ** 2 * self._index_moments()[1]
+
+    def rank(self, value) -> float:
+        """
+        The share of the other possible results that `value` beats, weighted by their chances, from 0 to 1.
+        Rolling the minimum gives 0, the maximum gives 1, and the median of a symmetric roll gives 0.5.
+        """
+        index = round((value - float(self.offset)) / float(self.step))
+        index = min(max(index, 0), len(self.pmf) - 1)
+        cdf = self.cdf
+        below = float(cdf[index - 1]) if index > 0 else 0.0
+        above = 1.0 - float(cdf[index])
+        if below + above <= 0:
+            return 0.5
+        return below / (below + above)
+
+    @property
+    def rank_variance(self) -> float:
+        """
+        The variance of `rank` over fair rolls. Dice with few possible results rank further from 0.5 than a uniform
+        percentile would (variance 1/12): a coin flip ranks 0 or 1, for a variance of 1/4.
+        """
+        if self._rank_variance is None:
+            if numpy is not None:
+                pmf = numpy.asarray(self.pmf)
+                above = 1.0 - numpy.asarray(self.cdf)
+                below = numpy.concatenate(([0.0], self.cdf[:-1]))
+                spread = below + above
+                ranks = numpy.divide(below, spread, out=numpy.full(len(pmf), 0.5), where=spread > 0)
+                mean = float(ranks @ pmf)
+                self._rank_variance = max(float((ranks - mean) ** 2 @ pmf), 0.0)
+            else:
+                ranks = []
+                below = 0.0
+                for cumulative in self.cdf:
+                    above = 1.0 - cumulative
+                    ranks.append(below / (below + above) if below + above > 0 else 0.5)
+                    below = cumulative
+                mean = sum(p * rank for p, rank in zip(self.pmf, ranks))
+                self._rank_variance = max(sum(p * (rank - mean) ** 2 for p, rank in zip(self.pmf, ranks)), 0.0)
+        return self._rank_variance
+
+    def _index_at_or_above(self, value) -> int:
+        return math.ceil((_fraction(value) - self.offset) / self.step)
+
+    def percentile(self, q: float) -> float:
+        """
+        The smallest value that at least a `q` (0 to 1) share of rolls are less than or equal to.
+        """
+        cdf = self.cdf
+        if numpy is not None:
+            return self.value(min(int(numpy.searchsorted(cdf, q - 1e-12)), len(cdf) - 1))
+        low, high = 0, len(cdf) - 1
+        while low < high:
+            middle = (low + high) // 2
+            if cdf[middle] < q - 1e-12:
+                low = middle + 1
+            else:
+                high = middle
+        return self.value(low)
+
+    def probability_at_least(self, value) -> float:
+        """
+        The chance of rolling `value` or more.
+        """
+        index = self._index_at_or_above(value)
+        if index <= 0:
+            return 1.0
+        if index >= len(self.pmf):
+            return 0.0
+        return max(1.0 - float(self.cdf[index - 1]), 0.0)
+
+
+def _accumulate(pmf):
+    total = 0.0
+    for p in pmf:
+        total += p
+        yield min(total, 1.0)
+
+
+def _lattice(plan) -> tuple:
+    """
+    Splits a plan into the constant part of its sum and its groups of dice by scale,
+    and works out the lattice step and number of possible results of the sum.
+    """
+    width = plan.end - plan.start + 1
+    # group dice with the same scale together; their shifts only move the result
+    groups = {}
+    shift = Fraction(0)
+    base = _affine(plan.modifiers)
+    targeted = dict(plan.targeted)
+    untargeted = plan.count - len(targeted)
+    for (scale, die_shift), count in [(base, untargeted)] + [(_affine(plan.modifiers + ops), 1) for ops in targeted.values()]:
+        if count == 0:
+            continue
+        shift += die_shift * count + scale * plan.start * count
+        if scale != 0 and width > 1:
+            groups[scale] = groups.get(scale, 0) + count
+
+    if not groups:
+        return shift, groups, Fraction(1), 1
+
+    # every group has to land on one lattice, so its step is the gcd of the group scales
+    scales = [abs(scale) for scale in groups]
+    step = Fraction(math.gcd(*(s.numerator for s in scales)), math.lcm(*(s.denominator for s in scales)))
+    support = sum(count * (width - 1) * int(abs(scale) / step) for scale, count in groups.items()) + 1
+    return shift, groups, step, support
+
+
+def support_size(plan) -> int:
+    """
+    How many possible results a plan's sum has, without computing its distribution.
+    """
+    return _lattice(plan)[3]
+
+
+def _build(plan) -> Distribution:
+    width = plan.end - plan.start + 1
+    offset, groups, step, support = _lattice(plan)
+    if support > (distribution_max_support if numpy is not None
+                  else min(distribution_max_support, _MAX_SUPPORT_WITHOUT_NUMPY)):
+        raise RollException("That expression has too many possible results to analyze.")
+
+    pmf = [1.0]
+    for scale, count in groups.items():
+        group_pmf = _stretch(_power([1.0 / width] * width, count), int(abs(scale) / step))
+        if scale < 0:
+            # a negative scale flips the group, so its highest raw sum is its lowest value
+            group_pmf = group_pmf[::-1]
+            offset += scale * (width - 1) * count
+        pmf = _convolve(pmf, group_pmf)
+    return Distribution(offset, step, _clean(pmf))
+
+
+# bounded by how many possible results the cached distributions have in total, not by how many there are,
+# since one big distribution can take as much memory as thousands of small ones
+distribution_cache = LRUCache(distribution_cache_points, weigh=len)
+
+
+def _key(plan) -> tuple:
+    return plan.count, plan.start, plan.end, plan.modifiers, plan.targeted
+
+
+def distribution_for(plan) -> Distribution:
+    """
+    Returns the exact distribution of a RollPlan's sum, computing it only if it isn't cached.
+    Raises RollException if it has too many possible results to compute.
+    """
+    return distribution_cache.get_or_create(_key(plan), lambda _: _build(plan))
+
+
+# distributions being built in the background, by key, so each is only built once at a time
+_warming = {}
+
+
+def _warm(plan):
+    try:
+        distribution_for(plan)
+    except RollException:
+        pass
+
+
+def warm_distribution(plan):
+    """
+    Starts building a plan's distribution in a thread, so it's cached the next time it's needed.
+    Does nothing if it's cached or being built already, if `_MAX_WARMING` are being built already,
+    or if there's no running event loop.
+    """
+    key = _key(plan)
+    if key in distribution_cache or key in _warming or len(_warming) >= _MAX_WARMING:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    _warming[key] = loop.create_task(asyncio.to_thread(_warm, plan))
+    _warming[key].add_done_callback(lambda _: _warming.pop(key, None))
+
+
+def cheap_distribution_for(plan, max_support: int):
+    """
+    Returns the distribution of a plan's sum if it is cached or has at most `max_support` possible results,
+    otherwise None. For callers that can't afford to wait on a big distribution.
+    Without NumPy, only much smaller distributions are built on the spot. One that's too slow to build on the spot,
+    but would otherwise have been, is built in the background instead (see `warm_distribution`),
+    so it can be used once it's done.
+    """
+    key = _key(plan)
+    if key in distribution_cache:
+        return distribution_for(plan)
+    try:
+        support = support_size(plan)
+        if numpy is None and support > _INLINE_SUPPORT_WITHOUT_NUMPY:
+            if support <= min(max_support, _MAX_SUPPORT_WITHOUT_NUMPY):
+                warm_distribution(plan)
+            return None
+        if support > max_support:
+            return None
+        return distribution_for(plan)
+    except RollException:
+        return None
@@ -1,29 +1,156 @@
-from random import randint, randrange
+import asyncio
+from collections import deque
+from random import randint
+from typing import Optional
 
-import requests
+import aiohttp
 
-try:
-    usernames = open("./data/usernames.txt")
-except FileNotFoundError:
-    usernames = None
+from backend.config import username_endpoint, username_timeout, username_pool_size, username_pool_low_water, \
+    username_rate
+from backend.utils.line_index import LineIndex
+from backend.utils.logging import log
 
-def random_line(afile):
+usernames = LineIndex.open("./data/usernames.txt")
+
+def fallback_username():
+    """
+    A username from the local list, for when the remote lookup fails.
+    """
+    if usernames:
+        return usernames.sample(1)[0]
+    else:
+        return "[generation failed]" #write a proper error handler later
+
+
+class UsernameGenerator:
+    """
+    Generates usernames by looking up random users on a remote endpoint, falling back to the local list.
+    `endpoint` is a URL with an `{id}` field that returns JSON with a "name"; it can be pointed at a local
+    stub server for tests and benchmarks. All lookups share one pooled HTTP session.
+    """
+
+    def __init__(self, endpoint: str = username_endpoint, timeout: float = username_timeout,
+                 max_connections: int = 10):
+        self.endpoint = endpoint
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_connections = max_connections
+        self._session = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # created on first use, since a session has to be made inside the running event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.max_connections),
+                                                  timeout=self.timeout)
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def fetch(self) -> Optional[str]:
+        """
+        Looks up one random username, returning None if the lookup fails or times out.
+        """
+        try:
+            async with self.session.get(self.endpoint.format(id=randint(1, 100_000_000))) as response:
+                return (await response.json())["name"]
+        except (aiohttp.ClientError, asyncio.TimeoutError, KeyError, TypeError, ValueError):
+            return None
+
+    async def generate(self, count: int = 1) -> list[str]:
+        """
+        Generates `count` usernames, looking them all up at once.
+        """
+        names = await asyncio.gather(*(self.fetch() for _ in range(count)))
+        return [name if name is not None else fallback_username() for name in names]
+
+
+class UsernamePool:
     """
-    Returns a random line from a file.
+    A pool of usernames looked up ahead of time, so requests are served from memory instead of the network.
+
+    A background task tops the pool back up to `size` whenever it drops below `low_water`, making at most
+    `rate` lookups per second. If a whole round of lookups fails, it backs off (doubling up to `max_backoff`
+    seconds) before trying again. When the pool runs dry, the missing names are looked up live.
     """
-    line = next(afile)
-    for num, aline in enumerate(afile, 2):
-        if randrange(num):
-            continue
-        line = aline
-    return line
-
-def get_random_username():
-    try:
-        response = requests.get(f"https://users.roblox.com/v1/users/{randint(1, 100_000_000)}")
-        return response.json()["name"]
-    except:
-        if usernames:
-            return random_line(usernames)
-        else:
-            return "[generation failed]" #write a proper error handler later
\ No newline at end of file
+
+    def __init__(self, generator: UsernameGenerator, size: int = username_pool_size,
+                 low_water: int = username_pool_low_water, rate: float = username_rate,
+                 batch: int = 10, max_backoff: float = 60.0):
+        self.generator = generator
+        self.size = size
+        self.low_water = low_water
+        self.rate = rate
+        self.batch = batch
+        self.max_backoff = max_backoff
+        self.names = deque(maxlen=size)
+        self._low = asyncio.Event()
+        self._task = None
+        # metrics
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.refilled = 0
+        self.failures = 0
+
+    def __len__(self):
+        return len(self.names)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._low.set()
+            self._task = asyncio.create_task(self._refill_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def take(self, count: int = 1) -> list[str]:
+        """
+        Takes `count` usernames from the pool, looking up whatever it's short of.
+        """
+        taken = [self.names.popleft() for _ in range(min(count, len(self.names)))]
+        self.hits += len(taken)
+        self.misses += count - len(taken)
+        if len(self.names) < self.low_water:
+            self._low.set()
+        if len(taken) < count:
+            taken += await self.generator.generate(count - len(taken))
+        return taken
+
+    async def _refill_loop(self):
+        backoff = 0.0
+        while True:
+            await self._low.wait()
+            self._low.clear()
+            self.refills += 1
+            while len(self.names) < self.size:
+                wanted = min(self.batch, self.size - len(self.names))
+                names = [name for name in await asyncio.gather(*(self.generator.fetch() for _ in range(wanted)))
+                         if name is not None]
+                self.failures += wanted - len(names)
+                self.names.extend(names)
+                self.refilled += len(names)
+                if names:
+                    backoff = 0.0
+                    # stay under the rate limit
+                    await asyncio.sleep(wanted / self.rate)
+                else:
+                    backoff = min(backoff * 2 or 1.0, self.max_backoff)
+                    log.warning(f"Username lookups are failing, retrying in {backoff:.0f}s")
+                    await asyncio.sleep(backoff)
+
+    def stats(self) -> dict:
+        return {"size": len(self.names), "hits": self.hits, "misses": self.misses, "refills": self.refills,
+                "refilled": self.refilled, "failures": self.failures}
+
+
+username_generator = UsernameGenerator()
+username_pool = UsernamePool(username_generator)
@@ -0,0 +1,341 @@
+"""
+The roll history behind /history and /luck.
+
+Every roll is appended as one fixed-size binary record (user, expression hash, total, percentile, the variance of
+a fair roll's percentile, time) to the current segment file under data/history/. Segments roll over after
+`segment_records` records, and only the latest `max_segments` are kept. Each user's latest records are found through
+an in-memory index of record positions, and their luck is kept as running sums, updated as records are
+added or dropped, so neither command ever rescans the log.
+
+When a segment is finished, a summary of it (each user's luck sums and latest record indexes in it) is saved next to
+it. At startup, the index and sums are rebuilt from those summaries, so only the current segment is read record by
+record, and dropping an old segment only takes its sums back out.
+"""
+import hashlib
+import json
+import math
+import os
+import struct
+import time
+from array import array
+from collections import deque
+from pathlib import Path
+from typing import Optional
+
+from backend.config import history_segment_records, history_max_segments, history_per_user
+from backend.utils.logging import log
+
+# user ID, expression hash, total, percentile and its variance (both NaN if they're unknown), unix time
+_RECORD = struct.Struct("<QQdddd")
+# records before the variance was stored; segments written with them are converted at startup
+_OLD_RECORD = struct.Struct("<QQddd")
+FORMAT_VERSION = 2
+# a position is a segment and a record index in it, packed into one int as `segment << _SEGMENT_SHIFT | index`
+_SEGMENT_SHIFT = 32
+
+
+class HistoryEntry:
+    def __init__(self, user_id: int, expression: str, total: float, percentile: Optional[float], timestamp: float):
+        self.user_id = user_id
+        self.expression = expression
+        self.total = total
+        self.percentile = percentile
+        self.timestamp = timestamp
+
+
+class Luck:
+    """
+    Running sums of a user's percentiles, and of how much a fair roll's percentile varies for each of their rolls.
+    A fair roller's average percentile tends to 0.5.
+    """
+
+    __slots__ = ("rolls", "total", "variance")
+
+    def __init__(self):
+        self.rolls = 0
+        self.total = 0.0
+        self.variance = 0.0
+
+    def add(self, percentile: float, variance: float, sign: int = 1):
+        self.rolls += sign
+        self.total += sign * percentile
+        self.variance += sign * variance
+
+    def merge(self, other: "Luck", sign: int = 1):
+        self.rolls += sign * other.rolls
+        self.total += sign * other.total
+        self.variance += sign * other.variance
+
+    @property
+    def average(self) -> float:
+        return self.total / self.rolls if self.rolls else 0.5
+
+    @property
+    def z_score(self) -> float:
+        """
+        How many standard errors the average is from 0.5. Percentiles of small dice vary more than uniform ones
+        (a coin flip's are 0 or 1), so the standard error comes from each roll's own variance.
+        """
+        if not self.rolls or self.variance <= 0:
+            return 0.0
+        return (self.total - 0.5 * self.rolls) / math.sqrt(self.variance)
+
+
+def expression_hash(expression: str) -> int:
+    return int.from_bytes(hashlib.blake2b(expression.encode(), digest_size=8).digest(), "little")
+
+
+class RollHistory:
+    def __init__(self, directory: Path, segment_records: int = history_segment_records,
+                 max_segments: int = history_max_segments, per_user: int = history_per_user):
+        self.directory = Path(directory)
+        self.segment_records = segment_records
+        self.max_segments = max_segments
+        self.per_user = per_user
+        self.positions: dict[int, deque] = {}
+        self.luck: dict[int, Luck] = {}
+        # expressions are stored by hash, so their text is kept in a file of its own
+        self.expressions: dict[int, str] = {}
+        self._segments: list[int] = []
+        # each finished segment's luck sums by user, taken back out when it's dropped
+        self._segment_luck: dict[int, dict[int, Luck]] = {}
+        # the current segment's summary, saved when it's finished
+        self._summary: dict[int, tuple[Luck, deque]] = {}
+        self._fd = None
+        self._records = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._load()
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.directory / f"segment-{segment:06d}.bin"
+
+    def _summary_path(self, segment: int) -> Path:
+        return self.directory / f"segment-{segment:06d}.summary"
+
+    @property
+    def _expressions_path(self) -> Path:
+        return self.directory / "expressions.txt"
+
+    @property
+    def _version_path(self) -> Path:
+        return self.directory / "version"
+
+    def _convert(self):
+        """
+        Rewrites segments from before the variance was stored. Their rolls are given the variance of a uniform
+        percentile, 1/12, which is what /luck assumed back then.
+        """
+        version = int(self._version_path.read_text()) if self._version_path.exists() else 1
+        if version >= FORMAT_VERSION:
+            return
+        for path in sorted(self.directory.glob("segment-*.bin")):
+            data = path.read_bytes()
+            whole = len(data) - len(data) % _OLD_RECORD.size
+            temporary = path.with_name(path.name + ".tmp")
+            with open(temporary, "wb") as file:
+                for user_id, key, total, percentile, timestamp in _OLD_RECORD.iter_unpack(data[:whole]):
+                    variance = math.nan if math.isnan(percentile) else 1 / 12
+                    file.write(_RECORD.pack(user_id, key, total, percentile, variance, timestamp))
+            temporary.replace(path)
+            log.info(f"Converted roll history {path.name} to format {FORMAT_VERSION}")
+        self._version_path.write_text(str(FORMAT_VERSION))
+
+    def _load(self):
+        self._convert()
+        if self._expressions_path.exists():
+            with open(self._expressions_path, encoding="utf-8") as expressions:
+                for line in expressions:
+                    key, _, expression = line.rstrip("\n").partition("\t")
+                    if key:
+                        self.expressions[int(key)] = expression
+
+        self._segments = sorted(int(path.stem.split("-")[1]) for path in self.directory.glob("segment-*.bin"))
+        if not self._segments:
+            self._segments.append(1)
+        for segment in self._segments[:-1]:
+            summary = self._load_summary(segment)
+            if summary is None:
+                # finished before summaries were saved, or the bot stopped before it could save one
+                summary, _ = self._scan(segment)
+                self._save_summary(segment, summary)
+            self._apply(segment, summary)
+            self._segment_luck[segment] = {user_id: luck for user_id, (luck, _) in summary.items()}
+
+        self._summary, self._records = self._scan(self._segments[-1])
+        self._apply(self._segments[-1], self._summary)
+        self._open(self._segments[-1])
+
+    def _scan(self, segment: int) -> tuple[dict, int]:
+        """
+        Reads a whole segment, record by record, into its summary. Also returns how many records it has.
+        """
+        path = self._segment_path(segment)
+        data = path.read_bytes() if path.exists() else b""
+        # a crash can leave half a record at the end, which is dropped
+        whole = len(data) - len(data) % _RECORD.size
+        if whole != len(data):
+            os.truncate(path, whole)
+        summary = {}
+        for index, record in enumerate(_RECORD.iter_unpack(data[:whole])):
+            self._summarize(summary, index, record)
+        return summary, whole // _RECORD.size
+
+    def _summarize(self, summary: dict, index: int, record: tuple):
+        user_id, _, _, percentile, variance, _ = record
+        if user_id not in summary:
+            summary[user_id] = (Luck(), deque(maxlen=self.per_user))
+        luck, indexes = summary[user_id]
+        indexes.append(index)
+        if not math.isnan(percentile):
+            luck.add(percentile, variance)
+
+    def _save_summary(self, segment: int, summary: dict):
+        """
+        A summary is one line of JSON with each user's luck sums and how many record indexes they have,
+        followed by all of the indexes, user after user, as 32-bit integers.
+        """
+        header = {}
+        indexes = array("I")
+        for user_id, (luck, user_indexes) in summary.items():
+            header[str(user_id)] = [luck.rolls, luck.total, luck.variance, len(user_indexes)]
+            indexes.extend(user_indexes)
+        path = self._summary_path(segment)
+        temporary = path.with_name(path.name + ".tmp")
+        with open(temporary, "wb") as file:
+            file.write(json.dumps(header, separators=(",", ":")).encode() + b"\n")
+            file.write(indexes.tobytes())
+        temporary.replace(path)
+
+    def _load_summary(self, segment: int) -> Optional[dict]:
+        try:
+            with open(self._summary_path(segment), "rb") as file:
+                header = json.loads(file.readline())
+                body = file.read()
+        except (FileNotFoundError, ValueError):
+            return None
+        indexes = array("I")
+        if len(body) % indexes.itemsize:
+            return None
+        indexes.frombytes(body)
+        if len(indexes) != sum(entry[3] for entry in header.values()):
+            return None
+        summary = {}
+        start = 0
+        for user_id, (rolls, total, variance, count) in header.items():
+            luck = Luck()
+            luck.rolls, luck.total, luck.variance = rolls, total, variance
+            summary[int(user_id)] = (luck, indexes[start:start + count])
+            start += count
+        return summary
+
+    def _apply(self, segment: int, summary: dict):
+        # segments have to be applied oldest first, so each user's deque ends with their latest records
+        base = segment << _SEGMENT_SHIFT
+        for user_id, (luck, indexes) in summary.items():
+            if user_id not in self.positions:
+                self.positions[user_id] = deque(maxlen=self.per_user)
+            self.positions[user_id].extend(map(base.__or__, indexes))
+            if luck.rolls:
+                self.luck.setdefault(user_id, Luck()).merge(luck)
+
+    def _open(self, segment: int):
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = os.open(self._segment_path(segment), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _index(self, segment: int, index: int, record: tuple):
+        user_id, _, _, percentile, variance, _ = record
+        if user_id not in self.positions:
+            self.positions[user_id] = deque(maxlen=self.per_user)
+        self.positions[user_id].append(segment << _SEGMENT_SHIFT | index)
+        if not math.isnan(percentile):
+            self.luck.setdefault(user_id, Luck()).add(percentile, variance)
+
+    def _roll_over(self):
+        finished = self._segments[-1]
+        # saved before the next segment exists, so a finished segment without a summary is always rescanned
+        self._save_summary(finished, self._summary)
+        self._segment_luck[finished] = {user_id: luck for user_id, (luck, _) in self._summary.items()}
+        self._summary = {}
+        segment = finished + 1
+        self._segments.append(segment)
+        self._open(segment)
+        self._records = 0
+        while len(self._segments) > self.max_segments:
+            self._drop(self._segments.pop(0))
+
+    def _drop(self, segment: int):
+        # take the dropped records back out of the luck sums; positions in it are skipped when read
+        for user_id, luck in self._segment_luck.pop(segment, {}).items():
+            if user_id in self.luck:
+                self.luck[user_id].merge(luck, -1)
+        self._segment_path(segment).unlink()
+        self._summary_path(segment).unlink(missing_ok=True)
+        log.info(f"Dropped roll history segment {segment}")
+
+    def record(self, user_id: int, expression: str, total: float, percentile: Optional[float],
+               variance: Optional[float] = None, timestamp: Optional[float] = None):
+        """
+        Appends a roll to the history. `variance` is how much a fair roll's percentile varies for the expression,
+        and is needed along with the percentile for the roll to count towards /luck.
+        """
+        if self._records >= self.segment_records:
+            self._roll_over()
+        key = expression_hash(expression)
+        if key not in self.expressions:
+            self.expressions[key] = expression
+            with open(self._expressions_path, "a", encoding="utf-8") as expressions:
+                expressions.write(f"{key}\t{expression}\n")
+        if percentile is None or variance is None:
+            percentile = variance = math.nan
+        record = (user_id, key, float(total), percentile, variance, time.time() if timestamp is None else timestamp)
+        os.write(self._fd, _RECORD.pack(*record))
+        self._index(self._segments[-1], self._records, record)
+        self._summarize(self._summary, self._records, record)
+        self._records += 1
+
+    def record_outcomes(self, user, outcomes):
+        """
+        A roll pipeline result hook that records every outcome of a roll.
+        """
+        if user is None:
+            return
+        for outcome in outcomes:
+            rank = outcome.rank()
+            percentile, variance = rank if rank is not None else (None, None)
+            self.record(user.id, outcome.plan.expression, outcome.total, percentile, variance)
+
+    def latest(self, user_id: int, count: int) -> list[HistoryEntry]:
+        """
+        A user's latest `count` rolls, newest first, read straight from their positions in the segments.
+        """
+        entries = []
+        oldest = self._segments[0]
+        files = {}
+        try:
+            for position in reversed(self.positions.get(user_id, ())):
+                segment, index = position >> _SEGMENT_SHIFT, position & ((1 << _SEGMENT_SHIFT) - 1)
+                if len(entries) >= count or segment < oldest:
+                    break
+                if segment not in files:
+                    files[segment] = os.open(self._segment_path(segment), os.O_RDONLY)
+                data = os.pread(files[segment], _RECORD.size, index * _RECORD.size)
+                _, key, total, percentile, _, timestamp = _RECORD.unpack(data)
+                entries.append(HistoryEntry(user_id, self.expressions.get(key, "?"), total,
+                                            None if math.isnan(percentile) else percentile, timestamp))
+        finally:
+            for fd in files.values():
+                os.close(fd)
+        return entries
+
+    def luck_of(self, user_id: int) -> Luck:
+        return self.luck.get(user_id, Luck())
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+roll_history = RollHistory(Path("data/history"))
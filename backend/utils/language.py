@@ -15,4 +15,12 @@ def s(number):
     """
     Plural. "s" if the number is not 1, else "".
     """
-    return "" if number == 1 else "s"
\ No newline at end of file
+    return "" if number == 1 else "s"
+
+def format_number(number, digits=2):
+    """
+    Formats a number for display, dropping the decimals from whole numbers.
+    """
+    if abs(number - round(number)) < 0.000000001:
+        return str(int(round(number)))
+    return f"{number:.{digits}f}"
@@ -0,0 +1,20 @@
+import importlib.util
+import sys
+
+
+def lazy_import(name: str):
+    """
+    Imports a module without running it until one of its attributes is first used, so heavy optional
+    dependencies don't slow down startup. Returns None if the module isn't installed.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,107 @@
+import mmap
+import os
+import random
+import struct
+from array import array
+from pathlib import Path
+from typing import Optional
+
+from backend.utils.logging import log
+
+# the sidecar starts with the size and modification time of the file it indexes, so a stale index is noticed
+_HEADER = struct.Struct("<QQ")
+# followed by every line's offset, as 8-byte integers
+_OFFSET = struct.Struct("<Q")
+
+
+class LineIndex:
+    """
+    Random access to the lines of a big text file, without reading the file.
+
+    The file is memory-mapped, and an index of where every line starts is built once and saved next to it
+    as `<file>.idx`. Later startups map the saved index instead of scanning the file again,
+    so picking k random lines is O(k) no matter how long the file is.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # an empty file can't be mapped
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self.offsets = self._load_index() or self._build_index()
+
+    @classmethod
+    def open(cls, path) -> Optional["LineIndex"]:
+        """
+        Indexes a file, or returns None if it doesn't exist.
+        """
+        try:
+            return cls(path)
+        except FileNotFoundError:
+            return None
+
+    @property
+    def sidecar(self) -> Path:
+        return self.path.with_name(self.path.name + ".idx")
+
+    def _signature(self) -> bytes:
+        stat = os.stat(self.path)
+        return _HEADER.pack(stat.st_size, stat.st_mtime_ns)
+
+    def _load_index(self):
+        try:
+            with open(self.sidecar, "rb") as sidecar:
+                if sidecar.read(_HEADER.size) != self._signature():
+                    return None
+                index_mmap = mmap.mmap(sidecar.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        # anything that isn't a whole index of this file is rebuilt, in case the sidecar was damaged some other way
+        body = memoryview(index_mmap)[_HEADER.size:]
+        offsets = body.cast("Q") if len(body) and len(body) % _OFFSET.size == 0 else None
+        if offsets is None or offsets[0] != 0 or offsets[-1] != len(self._mmap):
+            if offsets is not None:
+                offsets.release()
+            body.release()
+            index_mmap.close()
+            return None
+        self._index_mmap = index_mmap
+        return offsets
+
+    def _build_index(self):
+        """
+        Scans the file once for line starts. The last offset is the end of the file, so line i ends where i + 1 starts.
+        """
+        offsets = array("Q", [0])
+        data = self._mmap
+        position = data.find(b"\n")
+        while position != -1:
+            offsets.append(position + 1)
+            position = data.find(b"\n", position + 1)
+        if offsets[-1] != len(data):
+            offsets.append(len(data))
+        # written to a temporary file first, so a crash can't leave a half-written sidecar behind
+        temporary = self.sidecar.with_name(self.sidecar.name + ".tmp")
+        try:
+            with open(temporary, "wb") as sidecar:
+                sidecar.write(self._signature())
+                offsets.tofile(sidecar)
+            temporary.replace(self.sidecar)
+        except OSError as err:
+            log.warning(f"Couldn't save the line index for {self.path}: {err}")
+        return offsets
+
+    def __len__(self):
+        return max(len(self.offsets) - 1, 0)
+
+    def line(self, index: int) -> str:
+        return self._mmap[self.offsets[index]:self.offsets[index + 1]].decode(errors="replace").rstrip("\r\n")
+
+    def sample(self, k: int = 1, rng=random) -> list[str]:
+        """
+        Picks `k` random lines (independently, so the same line can come up twice).
+        """
+        if not len(self):
+            return []
+        return [self.line(rng.randrange(len(self))) for _ in range(k)]
@@ -0,0 +1,86 @@
+"""
+Saved roll macros. Each user's macros live in their "macros" field in the user database, as
+{name: {"rolls": ..., "version": ..., "plans": [...]}}, where "plans" are the compiled RollPlans of the rolls.
+Running a macro loads its plans directly instead of parsing the rolls again. Plans compiled by a different
+rollplayerlib version than the running one are recompiled from the rolls (and saved again) the first time they run.
+"""
+from typing import Optional
+
+from rollplayerlib import RollException
+
+from backend.utils.database import userdb, NotInDatabaseError
+from backend.utils.rolling import compile_expression, RollPlan, LIBRARY_VERSION
+
+MAX_MACROS = 25
+MAX_NAME_LENGTH = 32
+
+
+def _compile(rolls: str) -> dict:
+    plans = [compile_expression(expression) for expression in rolls.split()]
+    if not plans:
+        raise RollException("A macro needs something to roll!")
+    return {"rolls": " ".join(rolls.split()), "version": LIBRARY_VERSION, "plans": [plan.to_dict() for plan in plans]}
+
+
+async def _macros(user_id: int) -> dict:
+    # a copy of its own, since every caller changes it before saving it back
+    try:
+        return dict((await userdb.get(user_id)).get("macros", {}))
+    except NotInDatabaseError:
+        return {}
+
+
+async def _save_all(user_id: int, macros: dict):
+    try:
+        await userdb.update(user_id, {"macros": macros})
+    except NotInDatabaseError:
+        await userdb.insert(user_id, {"macros": macros})
+
+
+async def save_macro(user_id: int, name: str, rolls: str):
+    """
+    Compiles and saves a macro, replacing any macro with the same name.
+    Raises RollException if the name or rolls are invalid, or the user already has too many macros.
+    """
+    name = name.strip().lower()
+    if not name or len(name) > MAX_NAME_LENGTH:
+        raise RollException(f"Macro names have to be between 1 and {MAX_NAME_LENGTH} characters long.")
+    macros = await _macros(user_id)
+    if name not in macros and len(macros) >= MAX_MACROS:
+        raise RollException(f"You can't have more than {MAX_MACROS} macros. Delete one first!")
+    macros[name] = _compile(rolls)
+    await _save_all(user_id, macros)
+
+
+async def load_macro(user_id: int, name: str) -> Optional[tuple[str, list[RollPlan]]]:
+    """
+    Returns a macro's rolls and compiled plans, or None if the user has no macro with that name.
+    """
+    name = name.strip().lower()
+    macros = await _macros(user_id)
+    macro = macros.get(name)
+    if macro is None:
+        return None
+    if macro["version"] != LIBRARY_VERSION:
+        macro = macros[name] = _compile(macro["rolls"])
+        await _save_all(user_id, macros)
+    return macro["rolls"], [RollPlan.from_dict(plan) for plan in macro["plans"]]
+
+
+async def list_macros(user_id: int) -> dict[str, str]:
+    """
+    Returns the rolls of each of a user's macros, by name.
+    """
+    return {name: macro["rolls"] for name, macro in sorted((await _macros(user_id)).items())}
+
+
+async def delete_macro(user_id: int, name: str) -> bool:
+    """
+    Deletes a macro, returning whether it existed.
+    """
+    name = name.strip().lower()
+    macros = await _macros(user_id)
+    if macros.pop(name, None) is None:
+        return False
+    await _save_all(user_id, macros)
+    return True
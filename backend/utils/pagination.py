@@ -0,0 +1,100 @@
+from typing import Callable, Iterator, Optional
+
+import discord
+
+# Discord's limits for a single embed
+EMBED_LIMIT = 6000
+FIELD_COUNT_LIMIT = 25
+
+Field = tuple[str, str]
+
+
+def paginate(fields: Iterator[Field], budget: int = EMBED_LIMIT) -> Iterator[list[Field]]:
+    """
+    Lazily groups (name, value) fields into pages that each fit in one embed.
+    `budget` is how many characters the fields of a page may use; leave room for the embed's title and footer.
+    """
+    page, size = [], 0
+    for name, value in fields:
+        if page and (size + len(name) + len(value) > budget or len(page) == FIELD_COUNT_LIMIT):
+            yield page
+            page, size = [], 0
+        page.append((name, value))
+        size += len(name) + len(value)
+    if page:
+        yield page
+
+
+class EmbedPaginator(discord.ui.View):
+    """
+    A view that flips through pages of fields, only rendering a page when it's about to be shown.
+    `make_embed(fields, page_number)` turns a page into an embed.
+    """
+
+    def __init__(self, pages: Iterator[list[Field]], make_embed: Callable[[list[Field], int], discord.Embed],
+                 user: Optional[discord.abc.User] = None):
+        super().__init__(timeout=300)
+        self.pages = pages
+        self.make_embed = make_embed
+        self.user = user
+        self.rendered = []
+        self.index = 0
+        self.exhausted = False
+        self._fetch(0)
+        self._update_buttons()
+
+    def _fetch(self, index: int) -> bool:
+        """
+        Renders pages up to `index`, returning whether that page exists.
+        """
+        while len(self.rendered) <= index and not self.exhausted:
+            page = next(self.pages, None)
+            if page is None:
+                self.exhausted = True
+            else:
+                self.rendered.append(page)
+        return index < len(self.rendered)
+
+    @property
+    def is_paginated(self) -> bool:
+        """
+        Whether there's more than one page (if there isn't, the view doesn't need to be sent at all).
+        """
+        return self._fetch(1)
+
+    def embed(self) -> discord.Embed:
+        return self.make_embed(self.rendered[self.index], self.index + 1)
+
+    def _update_buttons(self):
+        self.previous_page.disabled = self.index == 0
+        # peeks one page ahead, so the next button knows whether there is a next page
+        self.next_page.disabled = not self._fetch(self.index + 1)
+        total = f"/{len(self.rendered)}" if self.exhausted else ""
+        self.page_number.label = f"Page {self.index + 1}{total}"
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        if self.user is not None and interaction.user != self.user:
+            await interaction.response.send_message("Only the person who rolled can flip through these pages!",
+                                                    ephemeral=True)
+            return False
+        return True
+
+    async def on_timeout(self):
+        # let go of the remaining pages, so their rolls can be freed
+        self.pages = iter(())
+
+    @discord.ui.button(label="◀", style=discord.ButtonStyle.secondary)
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.index -= 1
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
+
+    @discord.ui.button(label="Page 1", style=discord.ButtonStyle.secondary, disabled=True)
+    async def page_number(self, interaction: discord.Interaction, button: discord.ui.Button):
+        pass
+
+    @discord.ui.button(label="▶", style=discord.ButtonStyle.secondary)
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.index += 1
+        self._update_buttons()
+        await interaction.response.edit_message(embed=self.embed(), view=self)
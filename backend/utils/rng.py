@@ -0,0 +1,39 @@
+import hashlib
+import hmac
+import random
+
+from backend.config import rng_secret
+from backend.utils import sampling
+
+
+class RollStream:
+    """
+    The randomness for one command invocation, derived from the bot's secret and the invocation's ID.
+    Anyone holding the secret can rebuild the stream from the ID alone and replay every draw made from it,
+    so results never have to be stored to be audited.
+    """
+
+    def __init__(self, seed: int):
+        self.seed = seed
+        self.random = random.Random(seed)
+        self._generator = None
+
+    def __repr__(self):
+        return f"RollStream(seed={self.seed})"
+
+    @classmethod
+    def for_invocation(cls, invocation_id: int, purpose: str = "roll") -> "RollStream":
+        """
+        The stream for an interaction or message ID. `purpose` keeps streams for different kinds of draws apart.
+        """
+        digest = hmac.new(rng_secret.encode(), f"{purpose}:{invocation_id}".encode(), hashlib.sha256).digest()
+        return cls(int.from_bytes(digest[:16], "big"))
+
+    @property
+    def generator(self):
+        """
+        A NumPy generator seeded from the same seed (None without NumPy), created on first use.
+        """
+        if self._generator is None and sampling.numpy is not None:
+            self._generator = sampling.make_generator(self.seed)
+        return self._generator
@@ -0,0 +1,239 @@
+"""
+The roll pipeline shared by every way of rolling (/roll, r!roll, ...).
+
+A roll goes through five stages: parse, solve, bounds, color and render. Each stage is timed, and the time is
+passed to every registered timing hook, so it's possible to see where roll latency actually goes.
+The pipeline only produces a RollResponse; sending it is up to the caller.
+"""
+import itertools
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+import discord
+from discord.utils import MISSING
+from rollplayerlib import RollException
+
+from backend.config import embed_footer
+from backend.utils.embed_templates import embed_template, error_template
+from backend.utils.language import format_number
+from backend.utils.lerp import interpolate_color_hsv
+from backend.utils.logging import log
+from backend.utils.pagination import paginate, EmbedPaginator, EMBED_LIMIT
+from backend.utils.rng import RollStream
+from backend.utils.rolling import compile_expression, solve_many, stream_fields, pack, RollOutcome, RollPlan, \
+    FIELD_VALUE_LIMIT
+
+TimingHook = Callable[[str, float], None]
+# called with the user who rolled (None if unknown) and their outcomes, after every roll that isn't a replay
+ResultHook = Callable[[Optional[discord.abc.User], list[RollOutcome]], None]
+
+
+class StageStats:
+    """
+    A timing hook that keeps the count, total and worst time of each stage.
+    """
+
+    def __init__(self):
+        self.stages = {}
+
+    def __call__(self, stage: str, seconds: float):
+        count, total, worst = self.stages.get(stage, (0, 0.0, 0.0))
+        self.stages[stage] = (count + 1, total + seconds, max(worst, seconds))
+
+    def summary(self) -> str:
+        """
+        One line per stage with its average and worst time, in milliseconds.
+        """
+        if not self.stages:
+            return "no rolls yet"
+        return "\n".join(f"{stage}: {total / count * 1000:.2f}ms avg, {worst * 1000:.2f}ms worst ({count} runs)"
+                         for stage, (count, total, worst) in self.stages.items())
+
+
+def log_timing(stage: str, seconds: float):
+    """
+    A timing hook that logs every stage at debug level.
+    """
+    log.debug(f"roll pipeline: {stage} took {seconds * 1000:.2f}ms")
+
+
+class RollResponse:
+    """
+    What a roll should reply with. `view` is MISSING when the reply doesn't need one, so it can be passed straight on.
+    """
+
+    def __init__(self, embed: discord.Embed, view: discord.ui.View = MISSING):
+        self.embed = embed
+        self.view = view
+
+
+class RollPipeline:
+    def __init__(self, timing_hooks: Optional[list[TimingHook]] = None):
+        self.timing_hooks = list(timing_hooks) if timing_hooks else []
+        self.result_hooks: list[ResultHook] = []
+
+    def add_timing_hook(self, hook: TimingHook):
+        self.timing_hooks.append(hook)
+
+    def add_result_hook(self, hook: ResultHook):
+        self.result_hooks.append(hook)
+
+    def remove_result_hook(self, hook: ResultHook):
+        if hook in self.result_hooks:
+            self.result_hooks.remove(hook)
+
+    def _report(self, user: Optional[discord.abc.User], outcomes: list[RollOutcome]):
+        for hook in self.result_hooks:
+            try:
+                hook(user, outcomes)
+            except Exception as err:
+                # a broken hook shouldn't cost anyone their roll
+                log.error(f"Roll result hook {hook} failed: {err}")
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Times the code inside it as one stage of the pipeline.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            for hook in self.timing_hooks:
+                hook(name, elapsed)
+
+    def parse(self, rolls: str) -> list[RollPlan]:
+        with self.stage("parse"):
+            return [compile_expression(expression) for expression in rolls.split()]
+
+    async def solve(self, plans: list[RollPlan], batched: bool = False,
+                    stream: Optional[RollStream] = None) -> list[RollOutcome]:
+        with self.stage("solve"):
+            results = await solve_many(plans, batched, stream)
+        with self.stage("bounds"):
+            # a plan's bounds are worked out when it's compiled, so this just pairs them with the results
+            return [RollOutcome(plan, result) for plan, result in zip(plans, results)]
+
+    def color(self, outcomes: list[RollOutcome]) -> discord.Color:
+        with self.stage("color"):
+            normalized_results = [outcome.normalized() for outcome in outcomes]
+            return interpolate_color_hsv(sum(normalized_results) / len(normalized_results))
+
+    @staticmethod
+    def _respond(title: str, fields, color: discord.Color, user: Optional[discord.abc.User],
+                 roll_id: Optional[int], replay: bool = False) -> RollResponse:
+        # a replay is marked as one, so it can't be passed off as the roll itself
+        roll_note = f" • {'replay of roll' if replay else 'roll'} {roll_id}"
+
+        def make_embed(page_fields, page_number):
+            embed = embed_template(title)
+            embed.color = color
+            if roll_id is not None:
+                embed.set_footer(text=f"{embed_footer}{roll_note}")
+            for name, value in page_fields:
+                embed.add_field(name=name, value=value, inline=False)
+            return embed
+
+        # the title and footer count towards the embed's limit too
+        budget = EMBED_LIMIT - len(title) - len(embed_footer) - len(roll_note)
+        paginator = EmbedPaginator(paginate(fields, budget), make_embed, user)
+        return RollResponse(paginator.embed(), paginator if paginator.is_paginated else MISSING)
+
+    def render(self, title: str, outcomes: list[RollOutcome], color: discord.Color,
+               user: Optional[discord.abc.User], roll_id: Optional[int] = None, replay: bool = False) -> RollResponse:
+        with self.stage("render"):
+            fields = itertools.chain.from_iterable(stream_fields(outcome) for outcome in outcomes)
+            return self._respond(title, fields, color, user, roll_id, replay)
+
+    def render_table(self, title: str, names: list[str], outcomes: list[RollOutcome], color: discord.Color,
+                     user: Optional[discord.abc.User], sort: bool = True,
+                     roll_id: Optional[int] = None, replay: bool = False) -> RollResponse:
+        with self.stage("render"):
+            rows = [(name, format_number(outcome.total)) for name, outcome in zip(names, outcomes)]
+            if sort:
+                order = sorted(range(len(rows)), key=lambda i: outcomes[i].total, reverse=True)
+                rows = [rows[i] for i in order]
+            rank_width = len(str(len(rows)))
+            name_width = max(len(name) for name, _ in rows)
+            total_width = max(len(total) for _, total in rows)
+            lines = (f"{rank:>{rank_width}}. {name:<{name_width}}  {total:>{total_width}}"
+                     for rank, (name, total) in enumerate(rows, 1))
+            # each value is wrapped in a code block, so it gets less room for the table itself
+            values = pack((("\n" if i else "", line) for i, line in enumerate(lines)),
+                          FIELD_VALUE_LIMIT - len("```\n\n```"))
+            fields = ((("Results" if i == 0 else "Results (continued)"), f"```\n{value}\n```")
+                      for i, value in enumerate(values))
+            return self._respond(title, fields, color, user, roll_id, replay)
+
+    async def run(self, rolls: str, user: Optional[discord.abc.User] = None, roll_id: Optional[int] = None,
+                  title: Optional[str] = None, replay: bool = False) -> RollResponse:
+        """
+        Rolls a space-separated list of expressions, replying with an error embed if one of them is invalid.
+        `user` is the only one who can flip through the pages of a long result.
+        With a `roll_id` (the interaction or message ID), the roll draws from that ID's RollStream,
+        so it can be replayed exactly by running it again with the same ID. Replays aren't passed to the result hooks.
+        """
+        try:
+            plans = self.parse(rolls)
+        except RollException as exc:
+            return RollResponse(error_template(exc.information))
+        return await self.run_plans(plans, user, roll_id, title or f"--- {' '.join(rolls.split())} ---", replay)
+
+    async def run_plans(self, plans: list[RollPlan], user: Optional[discord.abc.User] = None,
+                        roll_id: Optional[int] = None, title: Optional[str] = None,
+                        replay: bool = False) -> RollResponse:
+        """
+        Rolls plans that are already compiled (like a saved macro's), skipping the parse stage. Otherwise the same as `run`.
+        """
+        stream = RollStream.for_invocation(roll_id) if roll_id is not None else None
+        try:
+            outcomes = await self.solve(plans, stream=stream)
+        except RollException as exc:
+            return RollResponse(error_template(exc.information))
+        if not replay:
+            self._report(user, outcomes)
+        color = self.color(outcomes)
+        title = title or f"--- {' '.join(plan.expression for plan in plans)} ---"
+        return self.render(title, outcomes, color, user, roll_id, replay)
+
+    async def run_batch(self, rolls: str, user: Optional[discord.abc.User] = None, sort: bool = True,
+                        roll_id: Optional[int] = None, replay: bool = False,
+                        title: Optional[str] = None) -> RollResponse:
+        """
+        Rolls a space-separated list of expressions as one batch, replying with a table of their totals
+        (highest first, if `sort`). Each expression can be labelled, like "goblin=1d20+3".
+        Identical expressions are only compiled once, and every die is drawn together.
+        `roll_id`, `replay` and `title` work the same as in `run`.
+        """
+        stream = RollStream.for_invocation(roll_id) if roll_id is not None else None
+        names = []
+        expressions = []
+        for token in rolls.split():
+            label, equals, expression = token.rpartition("=")
+            if not expression:
+                return RollResponse(error_template(f"\"{token}\" doesn't have anything to roll!"))
+            if equals and not label:
+                return RollResponse(error_template(f"\"{token}\" has an empty label!"))
+            names.append(f"{label} ({expression})" if label else expression)
+            expressions.append(expression)
+        if not expressions:
+            return RollResponse(error_template("Nothing to roll!"))
+        try:
+            plans = self.parse(" ".join(expressions))
+            # every name has to line up with its own roll in the table
+            if len(plans) != len(names):
+                raise RollException("Each roll in a batch has to be a single expression, separated by spaces.")
+            outcomes = await self.solve(plans, batched=True, stream=stream)
+        except RollException as exc:
+            return RollResponse(error_template(exc.information))
+        if not replay:
+            self._report(user, outcomes)
+        color = self.color(outcomes)
+        return self.render_table(title or f"--- Batch of {len(outcomes)} rolls ---", names, outcomes, color, user,
+                                 sort, roll_id, replay)
+
+
+stage_stats = StageStats()
+roll_pipeline = RollPipeline([stage_stats, log_timing])
@@ -0,0 +1,416 @@
+import asyncio
+import itertools
+import random
+from importlib.metadata import version as package_version
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from rollplayerlib import Format, UnifiedDice, RollResult, RollException, FormatType, Threshold, ThresholdType
+
+from backend.config import plan_cache_size, vectorize_threshold, cost_per_die, cost_per_modifier, offload_cost, \
+    offload_timeout, offload_workers, color_mode, color_max_support
+from backend.utils import sampling
+from backend.utils.distribution import cheap_distribution_for
+from backend.utils.cache import LRUCache
+from backend.utils.lerp import normalize
+
+# compiled plans are only valid for the rollplayerlib they were parsed with
+LIBRARY_VERSION = package_version("rollplayerlib")
+
+
+def apply_operation(value, operation, amount):
+    """
+    Applies a single rollplayerlib operation (+, -, *, /) to a value.
+    """
+    if operation == "+":
+        return value + amount
+    if operation == "-":
+        return value - amount
+    if operation == "*":
+        return value * amount
+    if operation == "/":
+        return value / amount
+    return value
+
+
+def apply_operations(value, operations):
+    """
+    Applies a chain of (operation, amount) pairs to a value, in order.
+    """
+    for operation, amount in operations:
+        value = apply_operation(value, operation, amount)
+    return value
+
+
+def _apply_to_list(values: list, operation, amount) -> list:
+    if operation == "+":
+        return [x + amount for x in values]
+    if operation == "-":
+        return [x - amount for x in values]
+    if operation == "*":
+        return [x * amount for x in values]
+    if operation == "/":
+        return [x / amount for x in values]
+    return values
+
+
+class RollPlan:
+    """
+    A roll expression that has been parsed once and can be rolled any number of times.
+
+    Every modifier rollplayerlib supports is an affine operation on a single die, so a plan only needs the dice
+    range, the operations applied to every die, and the extra operations applied to specific (0-based) dice.
+    Because each operation is monotonic, the bounds of a die are the images of the ends of its range,
+    which lets the plan know its minimum and maximum without solving the expression again.
+
+    Plans are shared through `plan_cache`, so they are immutable once built.
+    """
+
+    __slots__ = ("expression", "formatting", "count", "start", "end", "modifiers", "targeted", "minimum", "maximum")
+
+    def __init__(self, expression: str, dice: UnifiedDice, formatting: Format):
+        self.expression = expression
+        self.formatting = formatting
+        self.count = dice.basic_dice.count
+        self.start = dice.basic_dice.start
+        self.end = dice.basic_dice.end
+        self.modifiers = tuple((str(bonus.operation), bonus.value) for bonus in dice.bonuses)
+
+        targeted = {}
+        for bonus in dice.targeted_bonuses:
+            for operation, amount in bonus.operations:
+                for index in sorted(set(bonus.rolls)):
+                    if 1 <= index <= self.count:
+                        targeted.setdefault(index - 1, []).append((str(operation), amount))
+        self.targeted = tuple((index, tuple(operations)) for index, operations in sorted(targeted.items()))
+
+        self.minimum, self.maximum = self._bounds()
+
+    def __repr__(self):
+        return f"RollPlan(expression={self.expression!r}, dice={self.count}x{self.start}:{self.end}, " \
+               f"modifiers={self.modifiers}, targeted={self.targeted})"
+
+    def to_dict(self) -> dict:
+        """
+        The plan as JSON-safe data, so it can be stored and loaded back without parsing the expression again.
+        """
+        threshold = self.formatting.threshold
+        return {
+            "expression": self.expression,
+            "format": [self.formatting.format_type.value, self.formatting.format_args,
+                       [threshold.limit, threshold.threshold_type.value] if threshold else None],
+            "dice": [self.count, self.start, self.end],
+            "modifiers": [list(modifier) for modifier in self.modifiers],
+            "targeted": [[index, [list(operation) for operation in operations]] for index, operations in self.targeted],
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "RollPlan":
+        """
+        Rebuilds a plan from `to_dict`'s output.
+        """
+        plan = cls.__new__(cls)
+        format_type, format_args, threshold = data["format"]
+        plan.expression = data["expression"]
+        plan.formatting = Format(FormatType(format_type), format_args,
+                                 Threshold(threshold[0], ThresholdType(threshold[1])) if threshold else None)
+        plan.count, plan.start, plan.end = data["dice"]
+        plan.modifiers = tuple((operation, amount) for operation, amount in data["modifiers"])
+        plan.targeted = tuple((index, tuple((operation, amount) for operation, amount in operations))
+                              for index, operations in data["targeted"])
+        plan.minimum, plan.maximum = plan._bounds()
+        return plan
+
+    def die_bounds(self, operations) -> tuple:
+        """
+        Returns the lowest and highest value a single die can have after the given operations.
+        """
+        low = apply_operations(self.start, operations)
+        high = apply_operations(self.end, operations)
+        return min(low, high), max(low, high)
+
+    def _bounds(self) -> tuple:
+        low, high = self.die_bounds(self.modifiers)
+        untargeted = self.count - len(self.targeted)
+        minimum, maximum = untargeted * low, untargeted * high
+        for _, operations in self.targeted:
+            low, high = self.die_bounds(self.modifiers + operations)
+            minimum += low
+            maximum += high
+        return minimum, maximum
+
+    def apply(self, original_rolls: list) -> list:
+        """
+        Applies the plan's modifiers to a list of raw dice, the same way UnifiedDice.solve does.
+        """
+        rolls = original_rolls
+        for operation, amount in self.modifiers:
+            rolls = _apply_to_list(rolls, operation, amount)
+        if self.targeted:
+            rolls = rolls[:]
+            for index, operations in self.targeted:
+                rolls[index] = apply_operations(rolls[index], operations)
+        return rolls
+
+    def solve(self, rng=random) -> RollResult:
+        """
+        Rolls the plan once, using `rng` (anything with a `randint`) for randomness.
+        """
+        original_rolls = [rng.randint(self.start, self.end) for _ in range(self.count)]
+        return RollResult(self.expression, self.apply(original_rolls), original_rolls)
+
+
+class RollOutcome:
+    """
+    The result of rolling a plan, along with the bounds of what it could have rolled.
+    """
+
+    def __init__(self, plan: RollPlan, result: RollResult):
+        self.plan = plan
+        self.result = result
+
+    @property
+    def formatting(self) -> Format:
+        return self.plan.formatting
+
+    @property
+    def minimum(self):
+        return self.plan.minimum
+
+    @property
+    def maximum(self):
+        return self.plan.maximum
+
+    @property
+    def total(self):
+        return sum(self.result.rolls)
+
+    def percentile(self) -> Optional[float]:
+        """
+        Where the total ranks in the expression's exact distribution, from 0 to 1,
+        or None if the distribution is too big to build on the spot (until it's been built in the background).
+        """
+        distribution = cheap_distribution_for(self.plan, color_max_support)
+        return distribution.rank(self.total) if distribution is not None else None
+
+    def rank(self) -> Optional[tuple[float, float]]:
+        """
+        The total's `percentile`, and the variance of the percentiles fair rolls of the expression get,
+        or None if the distribution is too big to build on the spot.
+        """
+        distribution = cheap_distribution_for(self.plan, color_max_support)
+        return (distribution.rank(self.total), distribution.rank_variance) if distribution is not None else None
+
+    def normalized(self) -> float:
+        """
+        How good the total is, from 0 to 1.
+        With `color_mode = percentile`, this is its `percentile` (falling back to linear if that's unavailable);
+        with `color_mode = linear`, it's where the total falls between the minimum and maximum.
+        """
+        if color_mode == "percentile":
+            percentile = self.percentile()
+            if percentile is not None:
+                return percentile
+        return normalize(self.minimum, self.maximum, self.total)
+
+
+# Discord's limits for an embed field
+FIELD_NAME_LIMIT = 256
+FIELD_VALUE_LIMIT = 1024
+# how many rolls get formatted at a time while streaming
+_STREAM_BATCH = 256
+
+
+def _resolve_threshold(numbers: list, threshold: Threshold):
+    # "highlight the max/min" depends on every roll, so turn it into a fixed limit that each batch can check on its own
+    if threshold is None or not numbers:
+        return threshold
+    if threshold.threshold_type == ThresholdType.MAX:
+        limit = max(numbers)
+    elif threshold.threshold_type == ThresholdType.MIN:
+        limit = min(numbers)
+    else:
+        return threshold
+    # rounded the same way RollResult rounds the rolls it compares
+    limit = int(limit) if abs(limit - round(limit)) < 0.000000001 else limit
+    return Threshold(limit, ThresholdType.GREATER if threshold.threshold_type == ThresholdType.MAX else ThresholdType.LESS)
+
+
+def _number_pieces(result: RollResult, numbers: list, formatting: Format):
+    # yields (separator, text) for each roll, formatting them a batch at a time
+    for start in range(0, len(numbers), _STREAM_BATCH):
+        for index, string in enumerate(result._format_numbers(numbers[start:start + _STREAM_BATCH]), start):
+            if index == 0:
+                yield "", string
+            elif formatting.format_type == FormatType.FORMAT_LIST_SPLIT and index % formatting.format_args == 0:
+                yield "\n", string
+            else:
+                yield ", ", string
+
+
+def pack(pieces, limit: int = FIELD_VALUE_LIMIT):
+    """
+    Joins (separator, text) pieces into strings of at most `limit` characters, only ever splitting between pieces.
+    """
+    value = ""
+    for separator, text in pieces:
+        if value and len(value) + len(separator) + len(text) > limit:
+            yield value
+            value = text.lstrip()
+        else:
+            value += separator + text
+    if value:
+        yield value
+
+
+def stream_fields(outcome: RollOutcome):
+    """
+    Lazily formats an outcome the same way RollResult.format does, as (name, value) embed fields.
+    Values longer than a field allows are split over several fields instead of being built as one huge string.
+    """
+    result, formatting = outcome.result, outcome.formatting
+    sections = [(f"You rolled a {result.roll_string} and got...", result.rolls)]
+    if result.rolls != result.original_rolls:
+        sections.append((f"You rolled a {result.roll_string} and without modifiers got...", result.original_rolls))
+
+    for name, numbers in sections:
+        result.threshold = _resolve_threshold(numbers, formatting.threshold)
+        if formatting.format_type == FormatType.FORMAT_SUM:
+            pieces = [("", result._format_sum(numbers))]
+        else:
+            pieces = _number_pieces(result, numbers, formatting)
+            if formatting.format_type == FormatType.FORMAT_DEFAULT and len(numbers) > 1:
+                pieces = itertools.chain(pieces, [(" ", f"(sum: {result._format_sum(numbers)})")])
+        for i, value in enumerate(pack(pieces)):
+            yield (name if i == 0 else f"{name} (continued)")[:FIELD_NAME_LIMIT], value
+
+
+plan_cache = LRUCache(plan_cache_size)
+
+
+def _compile(expression: str) -> RollPlan:
+    stripped_expression, formatting = Format.parse(expression)
+    return RollPlan(stripped_expression, UnifiedDice.new(stripped_expression), formatting)
+
+
+def compile_expression(expression: str) -> RollPlan:
+    """
+    Returns the RollPlan for a roll expression (including its formatting), parsing it only if it isn't cached.
+    Raises RollException if the expression is invalid.
+    """
+    return plan_cache.get_or_create(expression, _compile)
+
+
+def solve_plan(plan: RollPlan, rng=random, generator=None) -> RollResult:
+    """
+    Rolls a plan once. Pools of at least `vectorize_threshold` dice are drawn as one array by the NumPy backend
+    (using `generator`, or the backend's own) when it's available; everything else is rolled with `rng`.
+    """
+    if plan.count >= vectorize_threshold and sampling.available(plan):
+        return sampling.solve(plan, generator)
+    return plan.solve(rng)
+
+
+def solve_batch(plans: list[RollPlan], rng=random, generator=None) -> list[RollResult]:
+    """
+    Rolls many plans at once. With the NumPy backend, identical plans are grouped together
+    and every die in the batch is drawn in one vectorized call.
+    """
+    if not plans or not all(sampling.available(plan) for plan in plans):
+        return [solve_plan(plan, rng, generator) for plan in plans]
+    groups = {}
+    for position, plan in enumerate(plans):
+        groups.setdefault(plan.expression, (plan, []))[1].append(position)
+    return sampling.solve_batch(list(groups.values()), len(plans), generator)
+
+
+def roll_expression(expression: str, rng=random, generator=None) -> RollOutcome:
+    """
+    Rolls an expression, parsing it only if its plan isn't cached.
+    Raises RollException if the expression is invalid.
+    """
+    plan = compile_expression(expression)
+    return RollOutcome(plan, solve_plan(plan, rng, generator))
+
+
+def estimate_cost(plans: list[RollPlan]) -> float:
+    """
+    Estimates how expensive rolling (and formatting) some plans is, from their dice and modifier counts.
+    Weighted by `cost_per_die` and `cost_per_modifier` in the config.
+    """
+    cost = 0
+    for plan in plans:
+        cost += plan.count * (cost_per_die + cost_per_modifier * len(plan.modifiers))
+        cost += cost_per_modifier * sum(len(operations) for _, operations in plan.targeted)
+    return cost
+
+
+_pool = None
+
+
+def _reseed():
+    # workers are forked with a copy of the parent's random state, so each one needs its own
+    random.seed()
+    if sampling.numpy is not None:
+        sampling.generator = sampling.make_generator()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=offload_workers, initializer=_reseed)
+    return _pool
+
+
+def shutdown_pool():
+    """
+    Stops the roll worker processes, killing any roll that is still running. A new pool is started on the next roll.
+    """
+    global _pool
+    pool, _pool = _pool, None
+    if pool is None:
+        return
+    # Executor.shutdown can't interrupt a running roll, so its processes have to be stopped directly.
+    # shutdown() forgets them, so they're taken first
+    processes = list((pool._processes or {}).values())
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join(1)
+        if process.is_alive():
+            process.kill()
+            process.join()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _solve_plans(plans: list[RollPlan], batched: bool = False, stream=None) -> list[RollResult]:
+    rng, generator = (stream.random, stream.generator) if stream is not None else (random, None)
+    if batched:
+        return solve_batch(plans, rng, generator)
+    return [solve_plan(plan, rng, generator) for plan in plans]
+
+
+async def solve_many(plans: list[RollPlan], batched: bool = False, stream=None) -> list[RollResult]:
+    """
+    Rolls several plans (with solve_batch if `batched`), drawing from `stream` (a RollStream) if one is given.
+    Cheap rolls are solved inline; rolls estimated to cost more than `offload_cost` are solved in a worker process,
+    so they can't block the event loop, and are killed after `offload_timeout` seconds.
+    Whether a roll is offloaded doesn't change what a stream rolls, since the stream travels with it.
+    Raises RollException if the roll times out.
+    """
+    if estimate_cost(plans) < offload_cost:
+        return _solve_plans(plans, batched, stream)
+
+    future = asyncio.get_running_loop().run_in_executor(_get_pool(), _solve_plans, plans, batched, stream)
+    try:
+        return await asyncio.wait_for(future, offload_timeout)
+    except asyncio.TimeoutError:
+        shutdown_pool()
+        raise RollException("That roll took too long to finish.")
+    except asyncio.CancelledError:
+        shutdown_pool()
+        raise
+    except BrokenProcessPool:
+        # another roll timed out and took the pool down with this one still in it
+        raise RollException("That roll was interrupted. Please try again.")
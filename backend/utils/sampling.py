@@ -0,0 +1,163 @@
+"""
+Optional NumPy backend for rolling big dice pools.
+Draws a whole pool as one array and applies modifiers and highlight thresholds as array operations.
+Everything here is a no-op if NumPy isn't installed; check `available` first.
+"""
+from rollplayerlib import RollResult, ThresholdType
+
+from backend.utils.lazy import lazy_import
+
+# only actually imported the first time it's used
+numpy = lazy_import("numpy")
+
+# NumPy's generators work on 64-bit integers, so ranges past this are left to the pure Python roller
+_INT_LIMIT = 2 ** 62
+
+
+def make_generator(seed=None):
+    """
+    Creates a NumPy random generator. With no seed, it is seeded from the OS's entropy.
+    """
+    return numpy.random.default_rng(seed)
+
+
+# the module's own generator, created on first use (see `default_generator`)
+generator = None
+
+
+def default_generator():
+    global generator
+    if generator is None:
+        generator = make_generator()
+    return generator
+
+
+def available(plan) -> bool:
+    """
+    Whether a plan can be rolled by this backend.
+    """
+    return numpy is not None and -_INT_LIMIT < plan.start and plan.end < _INT_LIMIT
+
+
+def _apply_to_array(values, operation, amount):
+    if operation == "+":
+        return values + amount
+    if operation == "-":
+        return values - amount
+    if operation == "*":
+        return values * amount
+    if operation == "/":
+        return values / amount
+    return values
+
+
+def _targeted_groups(plan) -> dict:
+    groups = {}
+    for index, operations in plan.targeted:
+        groups.setdefault(operations, []).append(index)
+    return groups
+
+
+def apply(plan, original_values):
+    """
+    Applies a plan's modifiers to an array of raw dice. The array equivalent of RollPlan.apply.
+    The dice are on the last axis, so a 2D array applies the plan to every row at once.
+    """
+    values = original_values
+    for operation, amount in plan.modifiers:
+        values = _apply_to_array(values, operation, amount)
+    if plan.targeted:
+        # targeted modifiers are written back into the array, so it has to be able to hold their results
+        values = values.astype(float)
+        for operations, indices in _targeted_groups(plan).items():
+            indices = numpy.array(indices)
+            targeted_values = values[..., indices]
+            for operation, amount in operations:
+                targeted_values = _apply_to_array(targeted_values, operation, amount)
+            values[..., indices] = targeted_values
+    return values
+
+
+def number_strings(values, threshold=None) -> list[str]:
+    """
+    Formats an array of rolls the way RollResult does: near-integers lose their decimals,
+    and rolls that pass the threshold are bolded.
+    """
+    if values.dtype.kind in "iu":
+        display = values
+        strings = values.astype(str)
+    else:
+        rounded = numpy.round(values)
+        near = numpy.abs(values - rounded) < 0.000000001
+        display = numpy.where(near, rounded, values)
+        if near.all():
+            strings = rounded.astype(numpy.int64).astype(str)
+        else:
+            strings = numpy.where(near, rounded.astype(numpy.int64).astype(str), values.astype(str))
+
+    if threshold is not None and len(display):
+        if threshold.threshold_type == ThresholdType.GREATER:
+            passing = display >= threshold.limit
+        elif threshold.threshold_type == ThresholdType.LESS:
+            passing = display <= threshold.limit
+        elif threshold.threshold_type == ThresholdType.MAX:
+            passing = display == display.max()
+        else:
+            passing = display == display.min()
+        strings = numpy.where(passing, numpy.char.add(numpy.char.add("**", strings), "**"), strings)
+
+    return strings.tolist()
+
+
+class VectorRollResult(RollResult):
+    """
+    A RollResult that keeps its rolls as arrays, so formatting them is done with array operations.
+    `rolls` and `original_rolls` are still plain lists for anything that sums or compares them.
+    """
+
+    def __init__(self, roll_string: str, values, original_values):
+        super().__init__(roll_string, values.tolist(), original_values.tolist())
+        self.values = values
+        self.original_values = original_values
+
+    def _format_numbers(self, numbers: list[int]):
+        if numbers and max(abs(max(numbers)), abs(min(numbers))) >= _INT_LIMIT:
+            # too big to round through int64 without losing digits
+            return super()._format_numbers(numbers)
+        if numbers is self.rolls:
+            return number_strings(self.values, self.threshold)
+        if numbers is self.original_rolls:
+            return number_strings(self.original_values, self.threshold)
+        return number_strings(numpy.asarray(numbers), self.threshold)
+
+
+def solve(plan, rng=None) -> VectorRollResult:
+    """
+    Rolls a plan with a NumPy generator (the module's own generator if none is given).
+    """
+    rng = default_generator() if rng is None else rng
+    original_values = rng.integers(plan.start, plan.end, size=plan.count, endpoint=True)
+    return VectorRollResult(plan.expression, apply(plan, original_values), original_values)
+
+
+def solve_batch(groups: list[tuple], size: int, rng=None) -> list[VectorRollResult]:
+    """
+    Rolls a batch of plans, drawing every die in the batch with a single generator call.
+    `groups` is a list of (plan, positions) pairs, giving the positions in the batch that roll that plan;
+    each plan's modifiers are applied to all of its rolls at once. Returns `size` results, in batch order.
+    """
+    rng = default_generator() if rng is None else rng
+    sizes = [plan.count * len(positions) for plan, positions in groups]
+    lows = numpy.repeat([plan.start for plan, _ in groups], sizes)
+    highs = numpy.repeat([plan.end for plan, _ in groups], sizes)
+    draws = rng.integers(lows, highs, endpoint=True)
+
+    results = [None] * size
+    offset = 0
+    for (plan, positions), group_size in zip(groups, sizes):
+        original_values = draws[offset:offset + group_size].reshape(len(positions), plan.count)
+        offset += group_size
+        values = apply(plan, original_values)
+        for row, position in enumerate(positions):
+            results[position] = VectorRollResult(plan.expression, values[row], original_values[row])
+    return results
@@ -1,6 +1,7 @@
 import asyncio
 import os
 import sys
+import time
 
 import threading
 from asyncio import create_task
@@ -8,23 +9,66 @@ from asyncio import create_task
 import discord.utils
 from discord.ext import commands
 
-from backend.config import discord_token, sync_server, should_sync, presence, version
+from backend.config import discord_token, sync_server, should_sync, sync_dry_run, presence, version, watch_cogs, \
+    watch_interval
 from backend.utils.logging import log
+from backend.utils.database import userdb
+from backend.utils.command_sync import sync_changed
+from backend.utils.cog_watcher import CogWatcher
+
+# for timing how long startup takes
+started = time.perf_counter()
 
 
 class RollplayerBot(commands.Bot):
-    coglist = []
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # the names of the cogs that are currently loaded
+        self.coglist = []
+        self.watcher = CogWatcher(self, interval=watch_interval)
 
-    async def setup_hook(self) -> None:
-        print(os.listdir('cogs'))
-        for file in os.listdir('cogs'):  # load cogs
-            if file.endswith('.py'):
-                print(file)
-                await bot.load_extension(f'cogs.{file[:-3]}')
-                self.coglist.append(file[:-3])
-                print(self.coglist)
+    @staticmethod
+    def available_cogs() -> list[str]:
+        return sorted(file[:-3] for file in os.listdir('cogs') if file.endswith('.py'))
+
+    async def load_cog(self, cog: str):
+        await self.load_extension(f'cogs.{cog}')
+        self.coglist.append(cog)
+
+    async def unload_cog(self, cog: str):
+        await self.unload_extension(f'cogs.{cog}')
+        self.coglist.remove(cog)
+
+    async def reload_cog(self, cog: str):
+        # if the new version fails to load, discord.py puts the old one back, so coglist stays right either way
+        await self.reload_extension(f'cogs.{cog}')
+
+    async def sync_commands(self):
         if should_sync:
-            await self.tree.sync(guild=bot.get_guild(sync_server))
+            # the global commands, and the sync server's own commands if there is one
+            guilds = [None] + ([discord.Object(id=sync_server)] if sync_server else [])
+            await sync_changed(self.tree, guilds, dry_run=sync_dry_run)
+
+    async def setup_hook(self) -> None:
+        userdb.start()
+        timings = {}
+        for cog in self.available_cogs():  # load cogs
+            load_start = time.perf_counter()
+            await self.load_cog(cog)
+            timings[cog] = time.perf_counter() - load_start
+        # slowest first, so it's obvious what to look at if startup gets slow
+        log.info(f"Loaded {len(timings)} cogs in {sum(timings.values()) * 1000:.0f}ms: " +
+                 ", ".join(f"{cog} {seconds * 1000:.0f}ms"
+                           for cog, seconds in sorted(timings.items(), key=lambda item: item[1], reverse=True)))
+        await self.sync_commands()
+        if watch_cogs:
+            self.watcher.start()
+
+    async def close(self) -> None:
+        await self.watcher.stop()
+        await super().close()
+        # writes out any user changes still waiting in the cache
+        await userdb.close()
 
 
 intents = discord.Intents.default()
@@ -36,7 +80,8 @@ bot = RollplayerBot(intents=intents, command_prefix="r!")  # Setting prefix
 # This is what gets run when the bot stars
 @bot.event
 async def on_ready():
-    log.info(f"Patron Saint of Vorigaria, version {version}, online. [logged in as {bot.user}]")
+    log.info(f"Patron Saint of Vorigaria, version {version}, online. [logged in as {bot.user}] "
+             f"(started in {time.perf_counter() - started:.2f}s)")
     await bot.change_presence(activity=discord.Game(name=presence))
 
 
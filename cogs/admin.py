@@ -0,0 +1,81 @@
+# Importing our custom variables/functions from backend
+from backend.utils.logging import log
+from backend.utils.embed_templates import embed_template, error_template
+
+from discord.ext import commands
+
+
+class AdminCog(commands.Cog):
+    """
+    Owner-only commands for updating the bot without restarting it.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    async def cog_check(self, ctx: commands.Context) -> bool:
+        return await self.client.is_owner(ctx.author)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        log.info("Cog: admin loaded")
+
+    async def _report(self, ctx: commands.Context, title: str, changes: list[str]):
+        if changes:
+            await self.client.sync_commands()
+        await ctx.send(embed=embed_template(title, "\n".join(changes) if changes else "Nothing changed."))
+
+    @commands.command("reload")
+    async def reload(self, ctx: commands.Context, *cogs: str):
+        """
+        Reloads the given cogs, or every cog whose file changed if none are given.
+        """
+        if not cogs:
+            await self._report(ctx, "Reloaded changed cogs", await self.client.watcher.check())
+            return
+        changes = []
+        for cog in cogs:
+            try:
+                if cog in self.client.coglist:
+                    await self.client.reload_cog(cog)
+                    changes.append(f"reloaded {cog}")
+                else:
+                    await self.client.load_cog(cog)
+                    changes.append(f"loaded {cog}")
+            except commands.ExtensionError as err:
+                changes.append(f"failed to update {cog}: {err}")
+        await self._report(ctx, "Reloaded cogs", changes)
+
+    @commands.command("unload")
+    async def unload(self, ctx: commands.Context, cog: str):
+        """
+        Unloads a cog.
+        """
+        if cog == "admin":
+            await ctx.send(embed=error_template("Unloading admin would leave no way to load it back!"))
+            return
+        try:
+            await self.client.unload_cog(cog)
+        except commands.ExtensionError as err:
+            await ctx.send(embed=error_template(str(err)))
+            return
+        await self._report(ctx, "Unloaded cog", [f"unloaded {cog}"])
+
+    @commands.command("watch")
+    async def watch(self, ctx: commands.Context):
+        """
+        Turns reloading cogs as soon as their files change on or off.
+        """
+        if self.client.watcher.running:
+            await self.client.watcher.stop()
+            await ctx.send(embed=embed_template("Stopped watching cogs."))
+        else:
+            self.client.watcher.start()
+            await ctx.send(embed=embed_template("Watching cogs for changes."))
+
+
+# The `setup` function is required for the cog to work
+# Don't change anything in this function, except for the
+# name of the cog to the name of your class.
+async def setup(client):
+    await client.add_cog(AdminCog(client))
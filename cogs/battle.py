@@ -1,9 +1,13 @@
 # Importing our custom variables/functions from backend
+import asyncio
+import math
 from typing import Optional
 
 from backend.utils.logging import log
-from backend.utils.battle import casualties
+from backend.utils.battle import casualties, simulate, numpy, BattleState
+from backend.utils.language import format_number
 from backend.utils.embed_templates import embed_template, error_template
+from backend.utils.rng import RollStream
 
 import discord
 from discord import app_commands
@@ -34,7 +38,95 @@ class BattleCog(commands.Cog):
             Percentage of an army that will be lost if it loses the battle. Defaults to 1/3-2/3.
         """
 
-        await interaction.response.send_message(embed=embed_template(casualties(side_a, side_b, loss)))
+        rng = RollStream.for_invocation(interaction.id, "battle").random
+        await interaction.response.send_message(embed=embed_template(casualties(side_a, side_b, loss, rng)))
+
+    @app_commands.command(name="battle_sim")
+    @app_commands.allowed_installs(guilds=True, users=True)
+    @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
+    async def battle_sim(self, interaction: discord.Interaction, side_a: app_commands.Range[int, 1],
+                         side_b: app_commands.Range[int, 1],
+                         trials: Optional[app_commands.Range[int, 1000, 1_000_000]]):
+        """
+        Simulates a battle many times, showing the odds of each outcome.
+
+        Parameters
+        ------------
+        side_a: int
+            The strength of the first side. Combination of both manpower and individual strength.
+        side_b: int
+            The strength of the second side.
+        trials: Optional[app_commands.Range[int, 1000, 1000000]]
+            How many times to simulate the battle. Defaults to 100000.
+        """
+        if numpy is None:
+            await interaction.response.send_message(embed=error_template("Simulating battles needs NumPy, "
+                                                                         "which isn't installed."))
+            return
+        if trials is None:
+            trials = 100_000
+
+        generator = RollStream.for_invocation(interaction.id, "battle_sim").generator
+        # run on another thread, under a CPU time budget, so a big simulation can't hold up the bot
+        result = await asyncio.to_thread(simulate, side_a, side_b, trials, generator)
+
+        embed = embed_template(f"--- {side_a} vs {side_b}, {result.trials:,} battles ---")
+        embed.add_field(name="Side A wins", value=f"{result.a_win_chance * 100:.1f}%")
+        embed.add_field(name="Side B wins", value=f"{(1 - result.a_win_chance) * 100:.1f}%")
+        for side, quantiles in (("A", result.a_quantiles), ("B", result.b_quantiles)):
+            embed.add_field(name=f"Side {side} survivors", inline=False, value="\n".join(
+                f"{round(q * 100)}th percentile: {format_number(survivors, 0)}"
+                for q, survivors in zip(result.QUANTILES, quantiles)))
+        if result.trials < trials:
+            embed.add_field(name="Note", value=f"Stopped after {result.trials:,} battles to save time.", inline=False)
+        await interaction.response.send_message(embed=embed)
+
+    @app_commands.command(name="war")
+    @app_commands.allowed_installs(guilds=True, users=True)
+    @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
+    async def war(self, interaction: discord.Interaction, sides: str, rounds: Optional[app_commands.Range[int, 1, 20]],
+                  loss: Optional[app_commands.Range[float, 0, 1]]):
+        """
+        Fights a war between up to 8 sides over several rounds.
+
+        Parameters
+        ------------
+        sides: str
+            The strength of each side, separated by spaces. For example: "1000 800 650".
+        rounds: Optional[app_commands.Range[int, 1, 20]]
+            How many rounds of fighting there are. Defaults to 1.
+        loss: Optional[app_commands.Range[float, 0, 1]]
+            Fraction of an army that will be lost if it loses a round, from 0 to 1. Defaults to 1/3-2/3, for each side.
+        """
+        if numpy is None:
+            await interaction.response.send_message(embed=error_template("Fighting wars needs NumPy, "
+                                                                         "which isn't installed."))
+            return
+        try:
+            strengths = [float(side) for side in sides.split()]
+            # float() happily reads "inf" and "nan", which can't be fought with (or rounded)
+            if not all(math.isfinite(strength) for strength in strengths):
+                raise ValueError
+        except ValueError:
+            await interaction.response.send_message(embed=error_template("Every side's strength has to be a number!"))
+            return
+        if not 2 <= len(strengths) <= 8 or min(strengths) < 0:
+            await interaction.response.send_message(embed=error_template("A war needs 2 to 8 sides, "
+                                                                         "none with negative strength!"))
+            return
+        if rounds is None:
+            rounds = 1
+
+        rng = RollStream.for_invocation(interaction.id, "battle").random
+        retreat = [loss if loss is not None else rng.uniform(1 / 3, 2 / 3) for _ in strengths]
+        state = BattleState(strengths, retreat, 1.5)
+        names = [f"Side {chr(ord('A') + i)}" for i in range(len(strengths))]
+        embed = embed_template(f"--- A war of {len(strengths)} sides ---")
+        for round_number in range(1, rounds + 1):
+            winner = int(state.step())
+            embed.add_field(name=f"Round {round_number}: {names[winner]} wins", inline=False, value=", ".join(
+                f"{name}: {round(strength)}" for name, strength in zip(names, state.strengths)))
+        await interaction.response.send_message(embed=embed)
 
 
 # The `setup` function is required for the cog to work
@@ -1,17 +1,15 @@
 # Importing our custom variables/functions from backend
-import random
 from typing import Optional
 
 from backend.utils.logging import log
 from backend.utils.language import list_format
 from backend.utils.embed_templates import embed_template, error_template
+from backend.utils.rng import RollStream
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 
-from tinydb import Query
-
 
 class ChooseCog(commands.Cog):
     def __init__(self, client):
@@ -42,16 +40,17 @@ class ChooseCog(commands.Cog):
         if unique is None:
             unique = True
 
+        rng = RollStream.for_invocation(interaction.id, "choose").random
         option_list = options.split(",")
         option_list = [x.strip() for x in option_list]
         if len(option_list) >= count:
             if count > 0:
                 if unique:
                     await interaction.response.send_message(
-                        embed=embed_template(f"let's pick... {list_format(random.sample(option_list, k=count))}."))
+                        embed=embed_template(f"let's pick... {list_format(rng.sample(option_list, k=count))}."))
                 else:
                     await interaction.response.send_message(
-                        embed=embed_template(f"let's pick... {list_format(random.choices(option_list,k=count))}."))
+                        embed=embed_template(f"let's pick... {list_format(rng.choices(option_list,k=count))}."))
             else:
                 await interaction.response.send_message(embed=error_template("Asked for zero or negative choices!"))
         else:
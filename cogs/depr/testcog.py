@@ -1,14 +1,12 @@
 # Importing our custom variables/functions from backend
 from backend.utils.logging import log
 from backend.utils.embed_templates import embed_template, error_template
-from backend.utils.database import userdb, create_new_user
+from backend.utils.database import userdb, create_new_user, NotInDatabaseError
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 
-from tinydb import Query
-
 
 class TestCog(commands.GroupCog, group_name="testing"):
     def __init__(self, client):
@@ -48,18 +46,13 @@ class TestCog(commands.GroupCog, group_name="testing"):
         """
         Database testing; counts up when used, then pulls from db to get return value.
         """
-        User = Query()
-        if userdb.contains(User.id == interaction.user.id):
-            try:
-                usercount = userdb.get(User.id == interaction.user.id)["count"]
-            except KeyError as e:
-                usercount = 0
-            usercount += 1
-            userdb.update({"count": usercount}, User.id == interaction.user.id)
-        else:
-            create_new_user(interaction.user.id)
-            userdb.update({"count": 1}, User.id == interaction.user.id)
-        count = userdb.get(User.id == interaction.user.id)["count"]
+        try:
+            user = await userdb.get(interaction.user.id)
+        except NotInDatabaseError:
+            await create_new_user(interaction.user.id)
+            user = {}
+        count = user.get("count", 0) + 1
+        await userdb.update(interaction.user.id, {"count": count})
         await interaction.response.send_message(f"your counter is {count}")
 
     @app_commands.command(name="test_one")
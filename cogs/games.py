@@ -4,7 +4,8 @@ import sys
 from typing import List
 from typing import Optional
 
-from backend.games.tictactoe import TicTacToe
+from backend.games.tictactoe import TicTacToe, MNKGame
+from backend.games.solver import choose_move
 from backend.games.map import start_game
 from backend.config import version
 from backend.utils.logging import log
@@ -15,8 +16,6 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
-from tinydb import Query
-
 
 @app_commands.allowed_installs(guilds=True, users=True)
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
@@ -31,7 +30,7 @@ class GamesCog(commands.GroupCog, group_name="game"):
     @app_commands.command(name="tictactoe")
     @app_commands.allowed_installs(guilds=True, users=True)
     @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
-    async def tictactoe(self, interaction: discord.Interaction, size: Optional[app_commands.Range[int, 3, 5]], row: Optional[app_commands.Range[int, 3, 5]]):
+    async def tictactoe(self, interaction: discord.Interaction, size: Optional[app_commands.Range[int, 3, 5]], row: Optional[app_commands.Range[int, 3, 5]], bot: Optional[bool]):
         """
         Creates a game of tic-tac-toe.
 
@@ -41,6 +40,8 @@ class GamesCog(commands.GroupCog, group_name="game"):
             The size of the board. Ranges from 3 to 5.
         row: Optional[app_commands.Range[int, 3, 5]]
             The amount of letters in a row you need to win. Defaults to the board size, but can go down to 3.
+        bot: Optional[bool]
+            Whether to play against the bot. You'll be X, and go first. Defaults to false.
         """
         if size is None:
             size = 3
@@ -49,7 +50,36 @@ class GamesCog(commands.GroupCog, group_name="game"):
         if row > size:
             await interaction.response.send_message(embed=error_template("Row length has to be less than or equal to the board size!"))
         else:
-            await interaction.response.send_message("Pick a place to start!", view=TicTacToe(size, row))
+            await interaction.response.send_message("Pick a place to start!", view=TicTacToe(size, row, choose_move if bot else None))
+
+    @app_commands.command(name="mnk")
+    @app_commands.allowed_installs(guilds=True, users=True)
+    @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
+    async def mnk(self, interaction: discord.Interaction, width: Optional[app_commands.Range[int, 3, 25]],
+                  height: Optional[app_commands.Range[int, 3, 25]], row: Optional[app_commands.Range[int, 3, 25]]):
+        """
+        Creates a game of tic-tac-toe on a big board, like gomoku.
+
+        Parameters
+        ------------
+        width: Optional[app_commands.Range[int, 3, 25]]
+            The width of the board. Defaults to 15.
+        height: Optional[app_commands.Range[int, 3, 25]]
+            The height of the board. Defaults to 15.
+        row: Optional[app_commands.Range[int, 3, 25]]
+            The amount of letters in a row you need to win. Defaults to 5.
+        """
+        if width is None:
+            width = 15
+        if height is None:
+            height = 15
+        if row is None:
+            row = min(5, max(width, height))
+        if row > max(width, height):
+            await interaction.response.send_message(embed=error_template("Row length has to fit on the board!"))
+        else:
+            view = MNKGame(width, height, row)
+            await interaction.response.send_message(view.content(view.status), view=view)
 
     """
     @app_commands.command(name="map")
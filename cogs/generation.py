@@ -2,7 +2,7 @@
 from typing import Optional
 
 from backend.utils.logging import log
-from backend.utils.generation import get_random_username
+from backend.utils.generation import username_generator, username_pool
 from backend.utils.language import s
 from backend.utils.embed_templates import embed_template, error_template
 
@@ -14,6 +14,13 @@ class GenerationCog(commands.Cog):
     def __init__(self, client):
         self.client = client
 
+    async def cog_load(self):
+        username_pool.start()
+
+    async def cog_unload(self):
+        await username_pool.stop()
+        await username_generator.close()
+
     @commands.Cog.listener()
     async def on_ready(self):
         log.info("Cog: generation loaded")
@@ -24,9 +31,7 @@ class GenerationCog(commands.Cog):
     async def username(self, interaction: discord.Interaction, count: Optional[app_commands.Range[int, 1, 10]]):
         if count is None:
             count = 1
-        usernames = []
-        for i in range(count):
-            usernames.append(get_random_username())
+        usernames = await username_pool.take(count)
         await interaction.response.send_message(embeds=[embed_template(f"Username{s(count)} generated!",
                                                                        "\n".join(usernames))])
 
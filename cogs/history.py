@@ -0,0 +1,88 @@
+# Importing our custom variables/functions from backend
+from typing import Optional
+
+from backend.utils.logging import log
+from backend.utils.history import roll_history
+from backend.utils.roll_pipeline import roll_pipeline
+from backend.utils.language import format_number, s
+from backend.utils.embed_templates import embed_template
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+
+class HistoryCog(commands.Cog):
+    def __init__(self, client):
+        self.client = client
+
+    async def cog_load(self):
+        roll_pipeline.add_result_hook(roll_history.record_outcomes)
+
+    async def cog_unload(self):
+        roll_pipeline.remove_result_hook(roll_history.record_outcomes)
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        log.info("Cog: history loaded")
+
+    @app_commands.command(name="history")
+    @app_commands.allowed_installs(guilds=True, users=True)
+    @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
+    async def history(self, interaction: discord.Interaction, count: Optional[app_commands.Range[int, 1, 25]]):
+        """
+        Shows your latest rolls.
+
+        Parameters
+        ------------
+        count: Optional[app_commands.Range[int, 1, 25]]
+            How many rolls to show. Defaults to 10.
+        """
+        if count is None:
+            count = 10
+        entries = roll_history.latest(interaction.user.id, count)
+        if not entries:
+            await interaction.response.send_message(embed=embed_template("You haven't rolled anything yet!"),
+                                                    ephemeral=True)
+            return
+        lines = []
+        for entry in entries:
+            percentile = f" ({entry.percentile * 100:.0f}th percentile)" if entry.percentile is not None else ""
+            lines.append(f"<t:{int(entry.timestamp)}:R> `{entry.expression}`: **{format_number(entry.total)}**{percentile}")
+        await interaction.response.send_message(embed=embed_template(f"Your last {len(entries)} roll{s(len(entries))}",
+                                                                     "\n".join(lines)), ephemeral=True)
+
+    @app_commands.command(name="luck")
+    @app_commands.allowed_installs(guilds=True, users=True)
+    @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
+    async def luck(self, interaction: discord.Interaction):
+        """
+        Shows how lucky your rolls have been compared to what you'd expect.
+        """
+        luck = roll_history.luck_of(interaction.user.id)
+        if not luck.rolls:
+            await interaction.response.send_message(embed=embed_template("You haven't rolled anything yet!"),
+                                                    ephemeral=True)
+            return
+        if luck.z_score >= 2:
+            verdict = "Suspiciously lucky!"
+        elif luck.z_score >= 1:
+            verdict = "Luckier than most."
+        elif luck.z_score > -1:
+            verdict = "About as lucky as anyone."
+        elif luck.z_score > -2:
+            verdict = "Unluckier than most."
+        else:
+            verdict = "The dice hate you."
+        embed = embed_template(f"How lucky is {interaction.user.display_name}?", verdict)
+        embed.add_field(name="Rolls", value=str(luck.rolls))
+        embed.add_field(name="Average percentile", value=f"{luck.average * 100:.1f}th (50th is average)")
+        embed.add_field(name="Standard score", value=format_number(luck.z_score))
+        await interaction.response.send_message(embed=embed)
+
+
+# The `setup` function is required for the cog to work
+# Don't change anything in this function, except for the
+# name of the cog to the name of your class.
+async def setup(client):
+    await client.add_cog(HistoryCog(client))
@@ -6,13 +6,14 @@ from typing import Optional
 from backend.config import version
 from backend.utils.logging import log
 from backend.utils.embed_templates import embed_template, error_template
+from backend.utils.rolling import plan_cache
+from backend.utils.generation import username_pool
+from backend.utils.roll_pipeline import stage_stats
 
 import discord
 from discord import app_commands
 from discord.ext import commands
 
-from tinydb import Query
-
 
 class InfoCog(commands.Cog):
     def __init__(self, client):
@@ -32,6 +33,16 @@ class InfoCog(commands.Cog):
         embed = embed_template(f"Rollplayer v{version} Info")
         embed.add_field(name="Python version", value=sys.version)
         embed.add_field(name="discord.py version", value=discord.__version__)
+        cache_stats = plan_cache.stats()
+        embed.add_field(name="Roll cache", value=f"{cache_stats['size']}/{cache_stats['maxsize']} expressions, "
+                                                 f"{cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                                                 f"{cache_stats['evictions']} evictions")
+        embed.add_field(name="Roll timings", value=stage_stats.summary(), inline=False)
+        pool_stats = username_pool.stats()
+        embed.add_field(name="Username pool", value=f"{pool_stats['size']}/{username_pool.size} ready, "
+                                                    f"{pool_stats['hits']} hits, {pool_stats['misses']} misses, "
+                                                    f"{pool_stats['refilled']} fetched in {pool_stats['refills']} "
+                                                    f"refills, {pool_stats['failures']} failed lookups")
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
 
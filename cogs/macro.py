@@ -0,0 +1,104 @@
+# Importing our custom variables/functions from backend
+from backend.utils.logging import log
+from backend.utils.macros import save_macro, load_macro, list_macros, delete_macro
+from backend.utils.roll_pipeline import roll_pipeline
+from backend.utils.embed_templates import embed_template, error_template
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+from rollplayerlib import RollException
+
+
+@app_commands.allowed_installs(guilds=True, users=True)
+@app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
+class MacroCog(commands.GroupCog, group_name="macro"):
+    def __init__(self, client):
+        self.client = client
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        log.info("Cog: macro loaded")
+
+    @app_commands.command(name="save")
+    async def save(self, interaction: discord.Interaction, name: str, rolls: str):
+        """
+        Saves rolls under a name, so you can roll them again with /macro run.
+
+        Parameters
+        ------------
+        name: str
+            The macro's name. Saving over an existing name replaces it.
+        rolls: str
+            The rolls to save, the same way you'd type them into /roll.
+        """
+        try:
+            await save_macro(interaction.user.id, name, rolls)
+        except RollException as exc:
+            await interaction.response.send_message(embed=error_template(exc.information), ephemeral=True)
+            return
+        await interaction.response.send_message(embed=embed_template(f"Saved macro \"{name.strip().lower()}\"!",
+                                                                     f"`{' '.join(rolls.split())}`"), ephemeral=True)
+
+    @app_commands.command(name="run")
+    async def run(self, interaction: discord.Interaction, name: str):
+        """
+        Rolls a saved macro.
+
+        Parameters
+        ------------
+        name: str
+            The name of the macro to roll.
+        """
+        try:
+            macro = await load_macro(interaction.user.id, name)
+        except RollException as exc:
+            # it was recompiled for a new version of the roller, and doesn't parse anymore
+            await interaction.response.send_message(embed=error_template(exc.information))
+            return
+        if macro is None:
+            await interaction.response.send_message(embed=error_template(f"You don't have a macro called \"{name}\"!"),
+                                                    ephemeral=True)
+            return
+        rolls, plans = macro
+        response = await roll_pipeline.run_plans(plans, interaction.user, roll_id=interaction.id,
+                                                 title=f"--- {name.strip().lower()}: {rolls} ---")
+        await interaction.response.send_message(embed=response.embed, view=response.view)
+
+    @app_commands.command(name="list")
+    async def list(self, interaction: discord.Interaction):
+        """
+        Lists your saved macros.
+        """
+        macros = await list_macros(interaction.user.id)
+        if not macros:
+            await interaction.response.send_message(embed=embed_template("You don't have any macros yet!",
+                                                                         "Save one with /macro save."), ephemeral=True)
+            return
+        # long rolls are cut short, so 25 of them still fit in one embed
+        lines = [f"**{name}**: `{rolls if len(rolls) <= 100 else rolls[:99] + '…'}`" for name, rolls in macros.items()]
+        await interaction.response.send_message(embed=embed_template("Your macros", "\n".join(lines)), ephemeral=True)
+
+    @app_commands.command(name="delete")
+    async def delete(self, interaction: discord.Interaction, name: str):
+        """
+        Deletes a saved macro.
+
+        Parameters
+        ------------
+        name: str
+            The name of the macro to delete.
+        """
+        if await delete_macro(interaction.user.id, name):
+            await interaction.response.send_message(embed=embed_template(f"Deleted macro \"{name.strip().lower()}\"."),
+                                                    ephemeral=True)
+        else:
+            await interaction.response.send_message(embed=error_template(f"You don't have a macro called \"{name}\"!"),
+                                                    ephemeral=True)
+
+
+# The `setup` function is required for the cog to work
+# Don't change anything in this function, except for the
+# name of the cog to the name of your class.
+async def setup(client):
+    await client.add_cog(MacroCog(client))
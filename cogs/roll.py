@@ -1,20 +1,27 @@
 # Importing our custom variables/functions from backend
+import asyncio
 from typing import Optional
 
 from backend.utils.logging import log
-from backend.utils.lerp import interpolate_color_hsv, normalize
+from backend.utils.rolling import shutdown_pool, compile_expression
+from backend.utils.roll_pipeline import roll_pipeline
+from backend.utils.distribution import distribution_for
+from backend.utils.language import format_number
 from backend.utils.embed_templates import embed_template, error_template
-from backend.utils.database import userdb, create_new_user
 
 import discord
 from discord import app_commands
 from discord.ext import commands
-from rollplayerlib import Format, UnifiedDice, SolveMode, RollException, FormatType
+from rollplayerlib import RollException
+
 
 class RollCog(commands.Cog):
     def __init__(self, client):
         self.client = client
 
+    async def cog_unload(self):
+        shutdown_pool()
+
     # Use @command.Cog.listener() for an event-listener (on_message, on_ready, etc.)
     @commands.Cog.listener()
     async def on_ready(self):
@@ -35,50 +42,93 @@ class RollCog(commands.Cog):
         if not rolls:
             rolls = "1d100"
 
-        # Split the input string into individual roll expressions
-        roll_expressions = rolls.split()
-
-        results = []
-        result_mins = []
-        result_maxs = []
-        formats = []
-
-        # Roll each expression and collect the results
-        for roll_expression in roll_expressions:
-            try:
-                stripped_expression, formatting = Format.parse(roll_expression)
-                result = UnifiedDice.new(stripped_expression).solve(SolveMode.RANDOM)
-                result_min = UnifiedDice.new(stripped_expression).solve(SolveMode.MIN)
-                result_max = UnifiedDice.new(stripped_expression).solve(SolveMode.MAX)
-                formats.append(formatting)
-                results.append(result)
-                result_mins.append(result_min)
-                result_maxs.append(result_max)
-            except RollException as exc:
-                await interaction.response.send_message(embed=error_template(exc.information))
-                return
-
-        embed = embed_template(f"--- {' '.join(roll_expressions)} ---")
-
-        normalized_results = [normalize(sum(mini.rolls), sum(maxi.rolls), sum(result.rolls)) for mini, maxi, result in
-                              zip(result_mins, result_maxs, results)]
-        normalized_color_value = sum(normalized_results) / len(normalized_results)
-
-        embed.color = interpolate_color_hsv(normalized_color_value)
-
-        for i, result in enumerate(results):
-            try:
-                for tup in result.format(formats[i]):
-                    if len(tup[1]) > 1024:
-                        raise RollException("Roll result too long.")
-                    embed.add_field(name=f"{tup[0]}", value=tup[1], inline=False)
-            except RollException:
-                embed.add_field(
-                    name=f"{roll_expressions[i]} - Your result was too long, so the format changed to sum only.",
-                    value="", inline=False)
-                for tup in result.format([[FormatType.FORMAT_SUM, 20]]):
-                    embed.add_field(name=f"{tup[0]}", value=tup[1])
+        response = await roll_pipeline.run(rolls, interaction.user, roll_id=interaction.id)
+        await interaction.response.send_message(embed=response.embed, view=response.view)
+
+    @app_commands.command(name="roll_batch")
+    @app_commands.allowed_installs(guilds=True, users=True)
+    @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
+    async def roll_batch(self, interaction: discord.Interaction, rolls: str, sort: Optional[bool]):
+        """
+        Rolls many dice at once, showing a table of their totals. Great for initiative!
+
+        Parameters
+        ------------
+        rolls: str
+            The rolls to roll, separated by spaces. Each one can be named, like "goblin=1d20+3 orc=1d20+1".
+        sort: Optional[bool]
+            If true, the table is sorted from highest to lowest total. Defaults to true.
+        """
+        if sort is None:
+            sort = True
 
+        response = await roll_pipeline.run_batch(rolls, interaction.user, sort, roll_id=interaction.id)
+        await interaction.response.send_message(embed=response.embed, view=response.view)
+
+    @app_commands.command(name="verify")
+    @app_commands.allowed_installs(guilds=True, users=True)
+    @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
+    async def verify(self, interaction: discord.Interaction, roll_id: str, rolls: str, batch: Optional[bool]):
+        """
+        Replays a roll exactly, to check that its result is genuine.
+
+        Parameters
+        ------------
+        roll_id: str
+            The roll's ID, shown at the bottom of its result.
+        rolls: str
+            The rolls that were rolled, exactly as they were typed.
+        batch: Optional[bool]
+            Whether it was rolled with /roll_batch.
+        """
+        try:
+            roll_id = int(roll_id)
+        except ValueError:
+            await interaction.response.send_message(embed=error_template("That isn't a valid roll ID!"))
+            return
+
+        if batch:
+            response = await roll_pipeline.run_batch(rolls, interaction.user, roll_id=roll_id, replay=True,
+                                                     title=f"--- Replay of batch {' '.join(rolls.split())} ---")
+        else:
+            response = await roll_pipeline.run(rolls, interaction.user, roll_id=roll_id,
+                                               title=f"--- Replay of {' '.join(rolls.split())} ---", replay=True)
+        await interaction.response.send_message(embed=response.embed, view=response.view)
+
+    @app_commands.command(name="roll_stats")
+    @app_commands.allowed_installs(guilds=True, users=True)
+    @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
+    async def roll_stats(self, interaction: discord.Interaction, expression: str, target: Optional[float]):
+        """
+        Shows the exact odds of a roll.
+
+        Parameters
+        ------------
+        expression: str
+            The roll to analyze. For example: "3d6+2".
+        target: Optional[float]
+            If given, also shows the chance of rolling at least this much.
+        """
+        try:
+            plan = compile_expression(expression)
+            # big expressions take a moment to compute; results are cached, so repeats are instant
+            distribution = await asyncio.to_thread(distribution_for, plan)
+        except RollException as exc:
+            await interaction.response.send_message(embed=error_template(exc.information))
+            return
+
+        embed = embed_template(f"--- Stats for {plan.expression} ---")
+        embed.add_field(name="Range", value=f"{format_number(distribution.minimum)} to "
+                                            f"{format_number(distribution.maximum)}")
+        embed.add_field(name="Mean", value=format_number(distribution.mean))
+        embed.add_field(name="Variance", value=f"{format_number(distribution.variance)} "
+                                               f"(std. dev. {format_number(distribution.variance ** 0.5)})")
+        embed.add_field(name="Percentiles", value="\n".join(
+            f"{percentile}th: {format_number(distribution.percentile(percentile / 100))}"
+            for percentile in (5, 25, 50, 75, 95)), inline=False)
+        if target is not None:
+            embed.add_field(name=f"Chance of rolling {format_number(target)} or more",
+                            value=f"{distribution.probability_at_least(target) * 100:.2f}%", inline=False)
         await interaction.response.send_message(embed=embed)
 
     @app_commands.command(name="roll_help")
@@ -125,51 +175,8 @@ That should be all you need to know about rolling with Rollplayer!""", ephemeral
         if not rolls:
             rolls = "1d100"
 
-        # Split the input string into individual roll expressions
-        roll_expressions = rolls.split()
-
-        results = []
-        result_mins = []
-        result_maxs = []
-        formats = []
-
-        # Roll each expression and collect the results
-        for roll_expression in roll_expressions:
-            try:
-                stripped_expression, formatting = Format.parse(roll_expression)
-                result = UnifiedDice.new(stripped_expression).solve(SolveMode.RANDOM)
-                result_min = UnifiedDice.new(stripped_expression).solve(SolveMode.MIN)
-                result_max = UnifiedDice.new(stripped_expression).solve(SolveMode.MAX)
-                formats.append(formatting)
-                results.append(result)
-                result_mins.append(result_min)
-                result_maxs.append(result_max)
-            except RollException as exc:
-                await ctx.send(embed=error_template(exc.information))
-                return
-
-        embed = embed_template(f"--- {' '.join(roll_expressions)} ---")
-
-        normalized_results = [normalize(sum(mini.rolls), sum(maxi.rolls), sum(result.rolls)) for mini, maxi, result in
-                              zip(result_mins, result_maxs, results)]
-        normalized_color_value = sum(normalized_results) / len(normalized_results)
-
-        embed.color = interpolate_color_hsv(normalized_color_value)
-
-        for i, result in enumerate(results):
-            try:
-                for tup in result.format(formats[i]):
-                    if len(tup[1]) > 1024:
-                        raise RollException("Roll result too long.")
-                    embed.add_field(name=f"{tup[0]}", value=tup[1], inline=False)
-            except RollException:
-                embed.add_field(
-                    name=f"{roll_expressions[i]} - Your result was too long, so the format changed to sum only.",
-                    value="", inline=False)
-                for tup in result.format([[FormatType.FORMAT_SUM, 20]]):
-                    embed.add_field(name=tup[0], value=tup[1])
-
-        await ctx.send(embed=embed)
+        response = await roll_pipeline.run(rolls, ctx.author, roll_id=ctx.message.id)
+        await ctx.send(embed=response.embed, view=response.view)
 
 
 # The `setup` function is required for the cog to work
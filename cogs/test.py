@@ -13,8 +13,6 @@ import discord
 from discord import app_commands
 from discord.ext import commands
 
-from tinydb import Query
-
 
 class TestCog(commands.Cog):
     def __init__(self, client):